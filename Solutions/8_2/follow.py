@@ -1,17 +1,189 @@
 # follow.py
+import io
 import os
 import time
 import csv
+from filewatch import FileWatcher
 
-def follow(filename):
+def read_checkpoint(checkpoint):
+    '''
+    Return the (device, inode, offset) saved in a checkpoint file,
+    or None if there isn't a usable one.
+    '''
+    try:
+        with open(checkpoint) as f:
+            dev, ino, offset = map(int, f.read().split())
+    except (FileNotFoundError, ValueError):
+        return None
+    return dev, ino, offset
+
+def write_checkpoint(checkpoint, st, offset):
+    '''
+    Durably save the identity of a file (from its os.stat() result) and
+    an offset in it.  The checkpoint is replaced atomically, so a crash
+    leaves either the old one or the new one.  The directory is synced
+    too, so that the rename itself survives a crash.
+    '''
+    tmpname = checkpoint + '.tmp'
+    with open(tmpname, 'w') as f:
+        f.write(f'{st.st_dev} {st.st_ino} {offset}\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpname, checkpoint)
+    dirfd = os.open(os.path.dirname(checkpoint) or '.', os.O_RDONLY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
+
+def start_offset(st, checkpoint):
+    '''
+    Work out where to start following a file: where the checkpoint left
+    off if it's for this file, at the start if the file was replaced or
+    truncated since, and at the end if there's no checkpoint.
+    '''
+    saved = read_checkpoint(checkpoint) if checkpoint else None
+    if saved is None:
+        return st.st_size
+    dev, ino, offset = saved
+    if (dev, ino) == (st.st_dev, st.st_ino) and offset <= st.st_size:
+        return offset
+    return 0
+
+def read_lines(f, blocksize):
+    '''
+    Read the complete lines in the next block of a binary file, as one
+    bytes string.  A partial line at the end is left in the file for later.
+    '''
+    data = f.read(blocksize)
+    if data and not data.endswith(b'\n'):
+        data += f.readline()
+        end = data.rfind(b'\n') + 1
+        f.seek(end - len(data), os.SEEK_CUR)
+        data = data[:end]
+    return data
+
+def line_offset(data, n):
+    '''
+    Return the offset just past the first n lines of data
+    '''
+    end = 0
+    for _ in range(n):
+        end = data.index(b'\n', end) + 1
+    return end
+
+def file_change(filename, f, offset):
+    '''
+    Check whether an open file f, read up to offset, is still the file at
+    filename.  Returns 'truncated' if it's been truncated below offset,
+    'replaced' if filename now names another file (it was rotated),
+    'missing' if nothing is there yet, or None if nothing has changed.
+    '''
+    st = os.fstat(f.fileno())
+    if st.st_size < offset:
+        return 'truncated'
+    try:
+        if not os.path.samestat(os.stat(filename), st):
+            return 'replaced'
+    except FileNotFoundError:
+        return 'missing'
+    return None
+
+def new_file_written(filename):
+    '''
+    Check whether the file now at filename (after a rotation) has been
+    written to, which means the writer has moved on from the old one
+    '''
+    try:
+        return os.stat(filename).st_size > 0
+    except FileNotFoundError:
+        return False
+
+def follow(filename, checkpoint=None, interval=1.0, blocksize=1 << 20, batches=False, grace=1.0):
     '''
     Generator that produces a sequence of lines being written at the end of a file.
+    The file is read in blocks of whatever has been written (up to
+    blocksize bytes), and with batches=True each block's lines are
+    produced together as a list.
+    If a checkpoint filename is given, the offset of the lines consumed so
+    far is saved there (every interval seconds, and whenever the follower
+    catches up) and following resumes from it next time.  A line (or
+    batch) counts as consumed once the next one is asked for, so none are
+    skipped.  Between writes, the follower sleeps until the file changes
+    (see filewatch.py).
+    Log rotation is followed.  If the file is truncated, following starts
+    again from the top.  If it's renamed or removed and a new file
+    appears at filename, the old file is still followed until the new
+    one has been written to, or the old one has been quiet for grace
+    seconds (the writer may take a while to reopen its log).  Then the
+    rest of the old file is produced, including an unfinished last line,
+    and the new file is followed from its start.
     '''
-    with open(filename,'r') as f:
-        f.seek(0,os.SEEK_END)
+    watcher = FileWatcher(filename)
+    f = open(filename,'rb')
+    st = os.fstat(f.fileno())
+    offset = start_offset(st, checkpoint)
+    saved = saved_at = None
+    f.seek(offset)
+
+    def save(offset, every=0):
+        nonlocal saved, saved_at
+        if checkpoint and saved != offset and (saved is None or time.monotonic() - saved_at >= every):
+            write_checkpoint(checkpoint, st, offset)
+            saved, saved_at = offset, time.monotonic()
+
+    save(offset)
+    data = b''         # Block being produced, starting at offset
+    consumed = 0       # Number of its lines consumed
+    quiet_since = None # When a rotated file last had anything to read
+    try:
         while True:
-             line = f.readline()
-             if line == '':
-                 time.sleep(0.1)    # Sleep briefly to avoid busy wait
-                 continue
-             yield line
+            data = read_lines(f, blocksize)
+            change = None
+            if data:
+                quiet_since = None
+            else:
+                save(offset)
+                change = file_change(filename, f, offset)
+                if change == 'truncated':
+                    offset = 0
+                    f.seek(0)
+                    save(offset)
+                    continue
+                elif change == 'missing':
+                    watcher.wait(0.1)      # Rotated, but the new file isn't there yet
+                    continue
+                elif change == 'replaced':
+                    if quiet_since is None:
+                        quiet_since = time.monotonic()
+                    if not new_file_written(filename) and time.monotonic() - quiet_since < grace:
+                        watcher.wait(0.1)  # The writer may still be finishing the old file
+                        continue
+                    data = f.read()        # Drain the old file
+                else:
+                    watcher.wait()         # Sleep until the file is written
+                    continue
+            if data:
+                lines = io.StringIO(data.decode(errors='replace'), newline='\n').readlines()
+                if batches:
+                    yield lines
+                else:
+                    for consumed, line in enumerate(lines):
+                        yield line
+                    consumed = 0
+                offset += len(data)
+                data = b''
+                save(offset, interval)
+            if change == 'replaced':
+                watcher.close()
+                f.close()
+                watcher = FileWatcher(filename)
+                f = open(filename,'rb')
+                st = os.fstat(f.fileno())
+                offset = 0
+                saved = quiet_since = None
+                save(offset)
+    finally:
+        save(offset + line_offset(data, consumed))
+        watcher.close()
+        f.close()
@@ -0,0 +1,152 @@
+# testfollow.py
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from follow import follow, read_checkpoint
+
+def later(delay, func, *args):
+    threading.Timer(delay, func, args).start()
+
+def append(filename, text):
+    with open(filename, 'a') as f:
+        f.write(text)
+
+class TestFollow(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.filename = os.path.join(tmpdir.name, 'log.txt')
+        self.checkpoint = os.path.join(tmpdir.name, 'log.ckpt')
+        open(self.filename, 'w').close()
+
+    def take(self, lines, n, timeout=5):
+        '''
+        Get the next n items from lines, failing if they don't turn up
+        '''
+        result = []
+        def run():
+            result.extend(next(lines) for _ in range(n))
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), f'timed out with {result}')
+        return result
+
+    def test_follow(self):
+        lines = follow(self.filename)
+        later(0.1, append, self.filename, 'a\nb\npart')
+        self.assertEqual(self.take(lines, 2), ['a\n', 'b\n'])
+        later(0.1, append, self.filename, 'ial\n')
+        self.assertEqual(self.take(lines, 1), ['partial\n'])
+        lines.close()
+
+    def test_polling(self):
+        from unittest import mock
+        import filewatch
+        with mock.patch.object(filewatch, '_libc', None):
+            lines = follow(self.filename)
+            later(0.1, append, self.filename, 'a\n')
+            self.assertEqual(self.take(lines, 1), ['a\n'])
+            lines.close()
+
+    def test_checkpoint_resume(self):
+        lines = follow(self.filename, checkpoint=self.checkpoint)
+        later(0.1, append, self.filename, 'a\nb\nc\n')
+        self.assertEqual(self.take(lines, 2), ['a\n', 'b\n'])
+        lines.close()
+        st = os.stat(self.filename)
+        # 'b' was produced but not consumed, so it comes again
+        self.assertEqual(read_checkpoint(self.checkpoint), (st.st_dev, st.st_ino, 2))
+
+        # Lines written while nobody is following are caught up on
+        append(self.filename, 'd\ne\n')
+        lines = follow(self.filename, checkpoint=self.checkpoint, blocksize=4)
+        self.assertEqual(self.take(lines, 4), ['b\n', 'c\n', 'd\n', 'e\n'])
+        later(0.1, append, self.filename, 'f\n')
+        self.assertEqual(self.take(lines, 1), ['f\n'])
+        lines.close()
+        self.assertEqual(read_checkpoint(self.checkpoint)[2], 10)
+
+    def test_batches(self):
+        lines = follow(self.filename, batches=True)
+        later(0.1, append, self.filename, 'a\nb\n')
+        self.assertEqual(self.take(lines, 1), [['a\n', 'b\n']])
+        lines.close()
+
+    def test_copytruncate(self):
+        lines = follow(self.filename, checkpoint=self.checkpoint)
+        later(0.1, append, self.filename, 'a\nb\n')
+        self.assertEqual(self.take(lines, 2), ['a\n', 'b\n'])
+        def rotate():
+            shutil.copy(self.filename, self.filename + '.1')
+            open(self.filename, 'r+').truncate(0)
+            later(0.2, append, self.filename, 'c\n')
+        later(0.1, rotate)
+        self.assertEqual(self.take(lines, 1), ['c\n'])
+        lines.close()
+
+    def test_truncate_checkpoint(self):
+        # The checkpoint goes back to the start as soon as the truncation is
+        # seen, not once the next interval is up
+        lines = follow(self.filename, checkpoint=self.checkpoint, interval=60)
+        later(0.1, append, self.filename, 'a\nb\n')
+        self.assertEqual(self.take(lines, 2), ['a\n', 'b\n'])
+        def truncate():
+            with open(self.filename, 'r+') as f:
+                f.truncate(0)
+                f.write('c\n')
+        later(0.1, truncate)
+        self.assertEqual(self.take(lines, 1), ['c\n'])
+        self.assertEqual(read_checkpoint(self.checkpoint)[2], 0)
+        lines.close()
+
+    def test_rename_create(self):
+        lines = follow(self.filename, checkpoint=self.checkpoint)
+        later(0.1, append, self.filename, 'a\n')
+        self.assertEqual(self.take(lines, 1), ['a\n'])
+        def rotate():
+            os.rename(self.filename, self.filename + '.1')
+            append(self.filename + '.1', 'b\n')
+            later(0.2, append, self.filename, 'c\n')
+        later(0.1, rotate)
+        self.assertEqual(self.take(lines, 2), ['b\n', 'c\n'])
+        lines.close()
+        st = os.stat(self.filename)
+        self.assertEqual(read_checkpoint(self.checkpoint), (st.st_dev, st.st_ino, 0))
+
+    def test_rename_late_writes(self):
+        # The writer goes on writing to the old file for a while after the
+        # rename, and finishes a line it had started
+        lines = follow(self.filename, checkpoint=self.checkpoint)
+        later(0.1, append, self.filename, 'a\nunfin')
+        self.assertEqual(self.take(lines, 1), ['a\n'])
+        def rotate():
+            os.rename(self.filename, self.filename + '.1')
+            open(self.filename, 'w').close()
+            later(0.3, append, self.filename + '.1', 'ished\nlate-old\n')
+            later(0.5, append, self.filename, 'new1\nnew2\n')
+        later(0.1, rotate)
+        self.assertEqual(self.take(lines, 4), ['unfinished\n', 'late-old\n', 'new1\n', 'new2\n'])
+        lines.close()
+
+    def test_rename_unfinished_line(self):
+        # An unfinished last line of the old file is produced once the
+        # old file has been quiet for the grace period
+        lines = follow(self.filename, grace=0.3)
+        later(0.1, append, self.filename, 'a\nlast')
+        self.assertEqual(self.take(lines, 1), ['a\n'])
+        def rotate():
+            os.rename(self.filename, self.filename + '.1')
+            open(self.filename, 'w').close()
+        later(0.1, rotate)
+        self.assertEqual(self.take(lines, 1), ['last'])
+        later(0.1, append, self.filename, 'new\n')
+        self.assertEqual(self.take(lines, 1), ['new\n'])
+        lines.close()
+
+if __name__ == '__main__':
+    unittest.main()
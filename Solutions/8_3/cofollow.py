@@ -1,16 +1,16 @@
 # cofollow.py
 import os
-import time
+from filewatch import FileWatcher
 
 def follow(filename, target):
-    with open(filename, 'r') as f:
+    with FileWatcher(filename) as watcher, open(filename, 'r') as f:
         f.seek(0,os.SEEK_END)
         while True:
             line = f.readline()
             if line != '':
                 target.send(line)
             else:
-                time.sleep(0.1)
+                watcher.wait()     # Sleep until the file is written
 
 # Decorator for coroutines
 from functools import wraps
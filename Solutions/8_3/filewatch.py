@@ -0,0 +1,78 @@
+# filewatch.py
+#
+# Waiting for a file to change.  On Linux, this uses inotify (through
+# ctypes) so that a waiter wakes up as soon as the file is written and
+# uses no CPU while it's idle.  Elsewhere it falls back to polling.
+
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+
+IN_MODIFY      = 0x0002
+IN_ATTRIB      = 0x0004
+IN_MOVE_SELF   = 0x0800
+IN_DELETE_SELF = 0x0400
+IN_NONBLOCK    = os.O_NONBLOCK
+IN_CLOEXEC     = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+WATCH_EVENTS = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+
+def load_inotify():
+    '''
+    Return the libc with inotify functions, or None if there isn't one
+    '''
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+_libc = load_inotify()
+
+class FileWatcher:
+    '''
+    Waits for a file to be written to (or moved, deleted or truncated).
+    Changes made after the watcher is created are never missed, even if
+    they happen while nobody is waiting.
+    '''
+    def __init__(self, filename, poll=0.1):
+        self.poll = poll
+        self.fd = None
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                if _libc.inotify_add_watch(fd, os.fsencode(filename), WATCH_EVENTS) >= 0:
+                    self.fd = fd
+                else:
+                    os.close(fd)
+
+    def wait(self, timeout=None):
+        '''
+        Wait until the file changes or timeout seconds pass.  When
+        polling, this just sleeps for a moment.
+        '''
+        if self.fd is None:
+            time.sleep(self.poll if timeout is None else min(self.poll, timeout))
+            return
+        if select.select([self.fd], [], [], timeout)[0]:
+            # Drain the queued events.  All that matters is that there were some.
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,378 @@
+# benchmark.py
+#
+# Timing comparisons for the structly reading code.  Run from this
+# directory:
+#
+#    python benchmark.py
+
+import csv
+import time
+from structly import *
+
+class Ticker(Structure):
+    name = String()
+    price = Float()
+    date = String()
+    time = String()
+    change = Float()
+    open = Float()
+    high = Float()
+    low = Float()
+    volume = Integer()
+
+def load_rows(filename='../../Data/dowstocks.csv'):
+    with open(filename) as f:
+        return list(csv.reader(f))
+
+def timed(label, func, *args, repeat=5, **kwargs):
+    best = min(_elapsed(func, *args, **kwargs) for _ in range(repeat))
+    print('%-30s %8.2f ms' % (label, best * 1000))
+    return best
+
+def _elapsed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+def bench_from_row(rows):
+    types = Ticker._types
+    generic = Structure.__dict__['from_row'].__func__
+
+    def raw_tuples(rows):
+        return [ tuple(func(val) for func, val in zip(types, row)) for row in rows ]
+
+    def generic_from_row(rows):
+        return [ generic(Ticker, row) for row in rows ]
+
+    def compiled_from_row(rows):
+        return [ Ticker.from_row(row) for row in rows ]
+
+    print('from_row: %d rows' % len(rows))
+    timed('raw tuples', raw_tuples, rows)
+    timed('Structure.from_row', generic_from_row, rows)
+    timed('Ticker.from_row', compiled_from_row, rows)
+    timed('Ticker.from_rows', Ticker.from_rows, rows)
+
+def bench_check(n=100000):
+    from structly.validate import PositiveInteger
+    values = list(range(n))
+
+    def cooperative(values):
+        check = PositiveInteger.check
+        for value in values:
+            check(value)
+
+    def compiled(values):
+        check = PositiveInteger.compiled_check
+        for value in values:
+            check(value)
+
+    print('PositiveInteger: %d checks' % n)
+    timed('check()', cooperative, values)
+    timed('compiled_check()', compiled, values)
+
+def bench_memory(rows):
+    import tracemalloc
+
+    def instances(rows):
+        return Ticker.from_rows(rows)
+
+    def table(rows):
+        table = StructureTable(Ticker)
+        for row in rows:
+            table.append([ func(val) for func, val in zip(Ticker._types, row) ])
+        return table
+
+    print('Memory: %d rows' % len(rows))
+    for label, func in [('list of Ticker', instances), ('StructureTable', table)]:
+        tracemalloc.start()
+        data = func(rows)
+        print('%-30s %8d bytes' % (label, tracemalloc.get_traced_memory()[0]))
+        tracemalloc.stop()
+        del data
+
+def bench_parallel(copies=100, workers=None):
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    with open('../../Data/dowstocks.csv') as f:
+        data = f.read().rstrip('\n') + '\n'
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+        f.write(data * copies)
+    try:
+        print('Parallel: %d copies of dowstocks.csv' % copies)
+        timed('read_csv_as_instances',
+              lambda: read_csv_as_instances(f.name, Ticker, headers=headers), repeat=1)
+        timed('read_csv_as_instances(workers)',
+              lambda: read_csv_as_instances(f.name, Ticker, headers=headers,
+                                            workers=workers or os.cpu_count()), repeat=1)
+    finally:
+        os.remove(f.name)
+
+def bench_mmap(filename='../../Data/dowstocks.csv'):
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    print('mmap: %s' % filename)
+    timed('read_csv_as_instances', read_csv_as_instances, filename, Ticker, headers=headers)
+    timed('read_mmap_as_instances', read_mmap_as_instances, filename, Ticker, headers=headers)
+
+def bench_projection(filename='../../Data/dowstocks.csv'):
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    print('Projection: %s' % filename)
+    timed('all fields', read_csv_as_instances, filename, Ticker, headers=headers)
+    timed('fields=[name, change]', read_csv_as_instances, filename, Ticker,
+          headers=headers, fields=['name', 'change'])
+
+def bench_where(filename='../../Data/dowstocks.csv'):
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    print('Filtering: %s' % filename)
+    timed('filter after conversion',
+          lambda: [ rec for rec in read_csv_as_instances(filename, Ticker, headers=headers)
+                    if rec.name == 'IBM' ])
+    timed('where=lambda name: ...', read_csv_as_instances, filename, Ticker,
+          headers=headers, where=lambda name: name == 'IBM')
+
+def bench_cache(copies=50):
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    with open('../../Data/dowstocks.csv') as f:
+        data = f.read().rstrip('\n') + '\n'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'dowstocks.csv')
+        with open(filename, 'w') as f:
+            f.write(data * copies)
+        print('Cache: %d copies of dowstocks.csv' % copies)
+        for reader in [read_csv_as_instances, read_csv_as_table]:
+            timed(reader.__name__, reader, filename, Ticker, headers=headers, repeat=1)
+            reader(filename, Ticker, headers=headers, cache=True)
+            timed(reader.__name__ + '(cache)', reader, filename, Ticker, headers=headers, cache=True)
+
+def bench_split(copies=50):
+    from structly.reader import split_csv
+    with open('../../Data/dowstocks.csv') as f:
+        lines = f.read().replace('"', '').splitlines(True) * copies
+    print('Splitting: %d quote-free lines' % len(lines))
+    timed('csv.reader', lambda: list(csv.reader(lines)))
+    timed('split_csv', lambda: list(split_csv(lines)))
+
+def bench_compressed(copies=50):
+    import gzip
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    with open('../../Data/dowstocks.csv', 'rb') as f:
+        data = f.read().rstrip(b'\n') + b'\n'
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'dowstocks.csv.gz')
+        with gzip.open(filename, 'wb') as f:
+            f.write(data * copies)
+        print('Compressed: %d copies of dowstocks.csv.gz' % copies)
+        timed('gzip only', lambda: gzip.open(filename).read(), repeat=3)
+        timed('read_csv_as_instances', read_csv_as_instances, filename, Ticker,
+              headers=headers, repeat=3)
+        timed('read_csv_as_instances(threaded)', read_csv_as_instances, filename, Ticker,
+              headers=headers, threaded=True, repeat=3)
+
+def bench_dirty(copies=50):
+    import io
+    import logging
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    with open('../../Data/dowstocks.csv') as f:
+        lines = (f.read().rstrip('\n') + '\n').splitlines(True) * copies
+    # Blank out the price of every 10th row
+    dirty = [ line if n % 10 else line.split(',', 2)[0] + ',,' + line.split(',', 2)[2]
+              for n, line in enumerate(lines) ]
+    handler = logging.StreamHandler(io.StringIO())
+    logging.getLogger('structly.reader').addHandler(handler)
+    logging.getLogger('structly.reader').propagate = False
+    with tempfile.TemporaryDirectory() as tmpdir:
+        clean, bad = os.path.join(tmpdir, 'clean.csv'), os.path.join(tmpdir, 'dirty.csv')
+        with open(clean, 'w') as f:
+            f.writelines(lines)
+        with open(bad, 'w') as f:
+            f.writelines(dirty)
+        print('Bad rows: %d rows, 10%% dirty' % len(lines))
+        timed('clean', read_csv_as_instances, clean, Ticker, headers=headers, repeat=3)
+        timed('dirty, log every row', lambda: read_csv_as_instances(bad, Ticker, headers=headers,
+              errors=BadRows(log_limit=len(lines))), repeat=3)
+        timed('dirty, BadRows()', lambda: read_csv_as_instances(bad, Ticker, headers=headers,
+              errors=BadRows()), repeat=3)
+    logging.getLogger('structly.reader').removeHandler(handler)
+    logging.getLogger('structly.reader').propagate = True
+
+def bench_nullable(copies=50):
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    class NullableTicker(Structure):
+        name = String()
+        price = NullableFloat()
+        date = String()
+        time = String()
+        change = NullableFloat()
+        open = NullableFloat()
+        high = NullableFloat()
+        low = NullableFloat()
+        volume = NullableInteger()
+    with open('../../Data/dowstocks.csv') as f:
+        lines = (f.read().rstrip('\n') + '\n').splitlines(True) * copies
+    print('Nullable: %d rows' % len(lines))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for percent in [0, 10, 50]:
+            filename = os.path.join(tmpdir, 'dowstocks%d.csv' % percent)
+            with open(filename, 'w') as f:
+                # Blank out the price of percent% of the rows
+                f.writelines(line if n % 100 >= percent else line.split(',', 2)[0] + ',,' + line.split(',', 2)[2]
+                             for n, line in enumerate(lines))
+            timed('read_csv_as_table(%d%% missing)' % percent, read_csv_as_table,
+                          filename, NullableTicker, headers=headers, repeat=3)
+        table = read_csv_as_table(filename, NullableTicker, headers=headers)
+        timed('sum(price * volume)', lambda: sum(p * v for p, v in table.present('price', 'volume')))
+
+def bench_dat(copies=100000):
+    import os
+    import tempfile
+    from operator import mul
+    with open('../../Data/portfolio.dat') as f:
+        data = f.read()
+    class Holding(Structure):
+        name = String()
+        shares = PositiveInteger()
+        price = PositiveFloat()
+
+    def pcost(filename):
+        total = 0.0
+        with open(filename) as f:
+            for line in f:
+                fields = line.split()
+                total += int(fields[1]) * float(fields[2])
+        return total
+
+    def line_table_cost(filename):
+        table = StructureTable(Holding)
+        with open(filename) as f:
+            for line in f:
+                name, shares, price = line.split()
+                table.append((name, int(shares), float(price)))
+        return sum(map(mul, table.column('shares'), table.column('price')))
+
+    def table_cost(filename):
+        table = read_dat_as_table(filename, Holding)
+        return sum(map(mul, table.column('shares'), table.column('price')))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'portfolio.dat')
+        with open(filename, 'w') as f:
+            f.write(data * copies)
+        print('Dat: %d copies of portfolio.dat' % copies)
+        timed('line by line (pcost)', pcost, filename, repeat=3)
+        timed('line by line into a table', line_table_cost, filename, repeat=3)
+        timed('read_dat_as_table', table_cost, filename, repeat=3)
+
+def bench_reordered(copies=20):
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    order = [8, 3, 0, 7, 1, 2, 6, 5, 4]
+    rows = load_rows() * copies
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ordered = os.path.join(tmpdir, 'ordered.csv')
+        reordered = os.path.join(tmpdir, 'reordered.csv')
+        with open(ordered, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        with open(reordered, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['extra'] + [ headers[n] for n in order ])
+            writer.writerows(['x'] + [ row[n] for n in order ] for row in rows)
+        print('Column layout: %d rows' % len(rows))
+        timed('same order as _fields', read_csv_as_instances, ordered, Ticker, repeat=3)
+        timed('reordered + extra column', read_csv_as_instances, reordered, Ticker, repeat=3)
+
+def bench_many(nfiles=20, copies=5, workers=None):
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    with open('../../Data/dowstocks.csv') as f:
+        data = ','.join(headers) + '\n' + (f.read().rstrip('\n') + '\n') * copies
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n in range(nfiles):
+            with open(os.path.join(tmpdir, 'shard%02d.csv' % n), 'w') as f:
+                f.write(data)
+        print('Many files: %d shards on %d cores' % (nfiles, os.cpu_count()))
+        timed('one file at a time', lambda: [ read_csv_as_table(os.path.join(tmpdir, name), Ticker)
+                                              for name in sorted(os.listdir(tmpdir)) ], repeat=1)
+        timed('read_many (processes)', read_many, tmpdir, Ticker, workers=workers, repeat=1)
+        timed('read_many (threads)', read_many, tmpdir, Ticker, workers=workers,
+              processes=False, repeat=1)
+
+def bench_spill(copies=20, memory_limit=4 << 20):
+    import os
+    import tempfile
+    import tracemalloc
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    with open('../../Data/dowstocks.csv') as f:
+        data = (f.read().rstrip('\n') + '\n') * copies
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'dowstocks.csv')
+        with open(filename, 'w') as f:
+            f.write(data)
+        print('Spilling: %d copies of dowstocks.csv, memory_limit=%d' % (copies, memory_limit))
+        for limit in [None, memory_limit]:
+            label = 'memory_limit=%s' % limit
+            records = read_csv_as_instances(filename, Ticker, headers=headers, memory_limit=limit)
+            timed(label, read_csv_as_instances, filename, Ticker, headers=headers,
+                  memory_limit=limit, repeat=3)
+            timed(label + ' (sum)', lambda: sum(rec.volume for rec in records), repeat=3)
+            del records
+            tracemalloc.start()
+            records = read_csv_as_instances(filename, Ticker, headers=headers, memory_limit=limit)
+            print('%-30s %8.1f MB peak' % (label, tracemalloc.get_traced_memory()[1] / 1e6))
+            tracemalloc.stop()
+            del records
+
+def bench_jsonl(copies=20):
+    import json
+    import os
+    import tempfile
+    headers = ['name','price','date','time','change','open','high','low','volume']
+    with open('../../Data/dowstocks.csv') as f:
+        data = (f.read().rstrip('\n') + '\n') * copies
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csvname = os.path.join(tmpdir, 'dowstocks.csv')
+        jsonname = os.path.join(tmpdir, 'dowstocks.jsonl')
+        with open(csvname, 'w') as f:
+            f.write(data)
+        records = read_csv_as_instances(csvname, Ticker, headers=headers)
+        print('JSON Lines: %d records' % len(records))
+        timed('write_jsonl', write_jsonl, jsonname, records, repeat=3)
+        timed('read_csv_as_instances', read_csv_as_instances, csvname, Ticker,
+              headers=headers, repeat=3)
+        timed('iter_jsonl_as_instances', lambda: list(iter_jsonl_as_instances(jsonname, Ticker)),
+              repeat=3)
+        def loads_and_init(filename):
+            with open(filename) as f:
+                return [ Ticker(**json.loads(line)) for line in f ]
+        timed('json.loads + Ticker(**obj)', loads_and_init, jsonname, repeat=3)
+
+if __name__ == '__main__':
+    bench_from_row(load_rows())
+    bench_check()
+    bench_memory(load_rows())
+    bench_parallel()
+    bench_mmap()
+    bench_projection()
+    bench_where()
+    bench_cache()
+    bench_split()
+    bench_compressed()
+    bench_dirty()
+    bench_nullable()
+    bench_dat()
+    bench_reordered()
+    bench_many()
+    bench_spill()
+    bench_jsonl()
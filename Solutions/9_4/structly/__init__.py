@@ -2,8 +2,12 @@
 
 from .structure import *
 from .reader import *
+from .table import *
+from .jsonl import *
 from .tableformat import *
 
 __all__ = [ *structure.__all__,
             *reader.__all__,
+            *table.__all__,
+            *jsonl.__all__,
             *tableformat.__all__ ]
@@ -0,0 +1,96 @@
+# compress.py
+
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+
+# Leading bytes of each supported compressed format
+_formats = [
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open) ]
+
+def compression(filename):
+    '''
+    Return the open() function for the compression used by a file,
+    judged by its first bytes, or None if it isn't compressed
+    '''
+    with open(filename, 'rb') as file:
+        magic = file.read(6)
+    for prefix, opener in _formats:
+        if magic.startswith(prefix):
+            return opener
+    return None
+
+class BackgroundReader(io.RawIOBase):
+    '''
+    Binary stream that reads blocks from another stream in a background
+    thread, so that decompression overlaps with whatever consumes the data
+    '''
+    def __init__(self, file, blocksize=1 << 20, nblocks=4):
+        self.file = file
+        self.blocksize = blocksize
+        self.blocks = queue.Queue(nblocks)
+        self.pending = memoryview(b'')
+        self.eof = False
+        self.stopping = False
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        try:
+            while not self.stopping:
+                block = self.file.read(self.blocksize)
+                self.blocks.put(block)
+                if not block:
+                    break
+        except Exception as e:
+            self.blocks.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending:
+            if self.eof:
+                return 0
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                self.eof = True
+                return 0
+            self.pending = memoryview(block)
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            # Unblock the thread if it's waiting on a full queue
+            self.stopping = True
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.file.close()
+        super().close()
+
+def open_text(filename, *, threaded=False):
+    '''
+    Open a file for reading text, decompressing gzip, bz2 and xz files
+    on the fly.  If threaded is true, decompression runs in a background
+    thread.
+    '''
+    opener = compression(filename)
+    if opener is None:
+        return open(filename)
+    file = opener(filename, 'rb')
+    if threaded:
+        file = io.BufferedReader(BackgroundReader(file))
+    return io.TextIOWrapper(file)
@@ -0,0 +1,123 @@
+# jsonl.py
+
+__all__ = [ 'iter_jsonl_as_instances',
+            'write_jsonl' ]
+
+import json
+from itertools import chain
+from .compress import open_text
+from .reader import BadRows, bad_rows
+from .validate import Missing, Nullable
+
+def json_keys(cls, keys=None):
+    '''
+    Return the JSON key of each field of cls.  keys is a dict of the
+    keys of the fields whose keys differ from their names.
+    '''
+    keys = keys or { }
+    return tuple(keys.get(name, name) for name in cls._fields)
+
+def json_field(validator, func):
+    '''
+    Make a function that converts the JSON value of a field.  Strings are
+    converted with func, as CSV fields are, and null is Missing for
+    nullable fields.  Values that JSON already typed are left as they
+    are for the field's check, except that booleans aren't numbers and
+    integers are floats for float fields.
+    '''
+    nullable = isinstance(validator, Nullable)
+    expected_type = getattr(validator, 'expected_type', None)
+    numeric = expected_type in (int, float)
+    def convert(value):
+        if type(value) is str:
+            return func(value)
+        if value is None and nullable:
+            return Missing
+        if numeric and type(value) is bool:
+            raise TypeError(f'expected {expected_type}')
+        if expected_type is float and type(value) is int:
+            return float(value)
+        return value
+    return convert
+
+def json_diagnosis(cls, converts):
+    '''
+    Make a diagnose(row) function for BadRows, for rows of the JSON
+    values of the fields (see row_diagnosis())
+    '''
+    checks = [ getattr(cls, name).compiled_check for name in cls._fields ]
+    def diagnose(row):
+        if isinstance(row, str):
+            return -1, BadRows.OTHER
+        for n, (convert, check, value) in enumerate(zip(converts, checks, row)):
+            if value is None or value == '':
+                try:
+                    check(convert(value))
+                except (ValueError, TypeError):
+                    return n, BadRows.MISSING
+                continue
+            try:
+                value = convert(value)
+            except (ValueError, TypeError):
+                return n, BadRows.TYPE
+            try:
+                check(value)
+            except TypeError:
+                return n, BadRows.TYPE
+            except ValueError:
+                return n, BadRows.CHECK
+        return -1, BadRows.OTHER
+    return diagnose
+
+def iter_jsonl_as_instances(filename, cls, *, keys=None, errors=None, threaded=False):
+    '''
+    Lazily read JSON Lines data (one JSON object per line) as a sequence
+    of instances, with the JSON keys of cls (see json_keys()).  String
+    values are converted as CSV fields are, and all values are checked
+    (see json_field()), so 12.9 isn't taken for an Integer field and
+    true isn't taken for a number.  Bad lines are reported as for
+    read_csv_as_instances().
+    '''
+    jkeys = json_keys(cls, keys)
+    fields = [ (key, json_field(getattr(cls, name), func))
+               for key, name, func in zip(jkeys, cls._fields, cls._types) ]
+    decode = json.loads
+    errors = bad_rows(errors, cls, list(jkeys))
+    errors.diagnose = json_diagnosis(cls, [ convert for key, convert in fields ])
+    with open_text(filename, threaded=threaded) as file:
+        for rowno, line in enumerate(file, start=1):
+            if line.isspace():
+                continue
+            try:
+                obj = decode(line)
+            except ValueError as e:
+                errors.add(rowno, line.rstrip('\n'), e)
+                continue
+            try:
+                record = cls(*[ convert(obj[key]) for key, convert in fields ])
+            except (ValueError, TypeError, KeyError) as e:
+                row = [ obj.get(key) for key in jkeys ] if isinstance(obj, dict) else repr(obj)
+                errors.add(rowno, row, e)
+                continue
+            yield record
+    errors.summary()
+
+def encode_missing(obj):
+    if obj is Missing:
+        return None
+    raise TypeError(f'{type(obj).__name__} is not JSON serializable')
+
+def write_jsonl(filename, records, *, keys=None):
+    '''
+    Write instances of a Structure class as JSON Lines, one object per
+    line.  keys is as for iter_jsonl_as_instances().  Missing values are
+    written as null.
+    '''
+    encode = json.JSONEncoder(separators=(',', ':'), default=encode_missing).encode
+    records = iter(records)
+    first = next(records, None)
+    with open(filename, 'w') as file:
+        if first is not None:
+            jkeys = json_keys(type(first), keys)
+            file.writelines(encode(dict(zip(jkeys, record))) + '\n'
+                            for record in chain([first], records))
@@ -1,43 +1,1058 @@
 # reader.py
 
+__all__ = [ 'read_csv_as_dicts',
+            'read_csv_as_instances',
+            'read_csv_as_table',
+            'iter_csv_as_dicts',
+            'iter_csv_as_instances',
+            'iter_csv_batches',
+            'infer_structure',
+            'BadRows',
+            'read_mmap_as_dicts',
+            'read_mmap_as_instances',
+            'read_many',
+            'read_dat_as_table' ]
+
 import csv
+import glob
+from array import array
+from collections import deque
+import hashlib
+import io
 import logging
+import mmap
+import os
+import pickle
+import re
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from inspect import signature
+from itertools import accumulate, chain, islice
+from keyword import iskeyword
+from types import CodeType
+from .table import StructureTable, column_check
+from .structure import typed_structure
+from .validate import (Integer, Float, String, InternedString, NullableInteger, NullableFloat,
+                       NullableString, missing_values)
+from .compress import compression, open_text
+from .spill import SpillList
 
 log = logging.getLogger(__name__)
 
-def convert_csv(lines, converter, *, headers=None):
-    rows = csv.reader(lines)
+def log_bad_row(rowno, row, e):
+    log.warning('Row %s: Bad row: %s', rowno, row)
+    log.debug('Row %s: Reason: %s', rowno, e)
+
+class BadRows:
+    '''
+    Compact report of the rows that failed to convert: arrays of row
+    numbers, column positions (-1 if unknown) and reason codes.  Only
+    the first log_limit bad rows are logged, the rest are just counted
+    and summed up by summary().  Nothing is logged if log_limit is None.
+    '''
+    reasons = ('other', 'missing', 'type', 'check')
+    OTHER, MISSING, TYPE, CHECK = range(4)
+
+    def __init__(self, log_limit=10):
+        self.log_limit = log_limit
+        self.rownos = array('q')
+        self.columns = array('i')
+        self.codes = array('b')
+        self.headers = None
+        self.diagnose = None
+
+    def __len__(self):
+        return len(self.rownos)
+
+    def __iter__(self):
+        '''
+        Produce (rowno, column name, reason) for each bad row
+        '''
+        for rowno, column, code in zip(self.rownos, self.columns, self.codes):
+            name = self.headers[column] if self.headers and column >= 0 else None
+            yield rowno, name, self.reasons[code]
+
+    def __repr__(self):
+        return '%s(<%d rows>)' % (type(self).__name__, len(self))
+
+    def __getstate__(self):
+        # diagnose() can't be pickled, and isn't needed after reading
+        return dict(self.__dict__, diagnose=None)
+
+    def add(self, rowno, row, e):
+        column, code = self.diagnose(row) if self.diagnose else (-1, self.OTHER)
+        self.rownos.append(rowno)
+        self.columns.append(column)
+        self.codes.append(code)
+        if self.log_limit is not None and len(self.rownos) <= self.log_limit:
+            log_bad_row(rowno, row, e)
+
+    def counts(self):
+        '''
+        Return a dict of the number of bad rows for each reason
+        '''
+        return { self.reasons[code]: self.codes.count(code)
+                 for code in range(len(self.reasons)) if code in self.codes }
+
+    def summary(self):
+        '''
+        Log the number of bad rows by reason, if not all of them were logged
+        '''
+        if self.log_limit is not None and len(self) > self.log_limit:
+            log.warning('%d bad rows (%s), %d not shown', len(self), self.describe(),
+                        len(self) - self.log_limit)
+
+    def describe(self):
+        return ', '.join(f'{count} {reason}' for reason, count in self.counts().items())
+
+def split_csv(lines, sample=100):
+    '''
+    Split lines of CSV text into rows.  Works like csv.reader(), but
+    uses plain str.split() for as long as no quote characters appear
+    in the lines, starting with a sample of the first lines.
+    '''
+    lines = iter(lines)
+    head = list(islice(lines, sample))
+    if any('"' in line for line in head):
+        yield from csv.reader(chain(head, lines))
+        return
+
+    lines = chain(head, lines)
+    for line in lines:
+        if '"' in line:
+            yield from csv.reader(chain([line], lines))
+            return
+        line = line.rstrip('\r\n')
+        yield line.split(',') if line else []
+
+def convert_rows(rows, converter, *, headers=None, records=None, keep=None, errors=None):
+    '''
+    Convert a sequence of already split rows into records with
+    converter(headers, row). Bad rows, including short and blank ones,
+    are added to errors (a BadRows) and skipped, as are rows for which
+    keep(row) is false.
+    '''
+    if records is None:
+        records = []
     if headers is None:
-        headers = next(rows)
+        headers = next(rows, None)
+        if headers is None:
+            return records
+    if errors is None:
+        errors = BadRows()
+    append = records.append
+    for rowno, row in enumerate(rows, start=1):
+        try:
+            if keep is None or keep(row):
+                append(converter(headers, row))
+        except (ValueError, IndexError, TypeError) as e:
+            errors.add(rowno, row, e)
+    errors.summary()
+    return records
 
-    records = []
+def iter_convert_rows(rows, converter, *, headers=None, keep=None, errors=None):
+    '''
+    Generator version of convert_rows() that produces records one
+    at a time instead of collecting them into a list
+    '''
+    if headers is None:
+        headers = next(rows, None)
+        if headers is None:
+            return
+
+    if errors is None:
+        errors = BadRows()
     for rowno, row in enumerate(rows, start=1):
         try:
-            records.append(converter(headers, row))
-        except ValueError as e:
-            log.warning('Row %s: Bad row: %s', rowno, row)
-            log.debug('Row %s: Reason: %s', rowno, row)
+            if keep is not None and not keep(row):
+                continue
+            record = converter(headers, row)
+        except (ValueError, IndexError, TypeError) as e:
+            errors.add(rowno, row, e)
+            continue
+        yield record
+    errors.summary()
+
+def convert_csv(lines, converter, *, headers=None, records=None, errors=None):
+    return convert_rows(split_csv(lines), converter, headers=headers, records=records, errors=errors)
+
+def iter_convert_csv(lines, converter, *, headers=None, errors=None):
+    return iter_convert_rows(split_csv(lines), converter, headers=headers, errors=errors)
+
+def csv_ranges(file, start, end, nchunks):
+    '''
+    Split the bytes start:end of a binary file into at most nchunks
+    (start, end) ranges that begin and end on line boundaries
+    '''
+    bounds = [ start ]
+    for n in range(1, nchunks):
+        file.seek(start + (end - start) * n // nchunks)
+        file.readline()
+        bound = min(file.tell(), end)
+        if bound > bounds[-1]:
+            bounds.append(bound)
+    if end > bounds[-1]:
+        bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+def convert_csv_range(filename, start, end, make_converter, spec, headers, select, where):
+    '''
+    Convert the rows in bytes start:end of a file. Runs in a worker
+    process, so the converter is made there by make_converter().
+    Returns the records, the number of rows seen and a list of bad rows.
+    '''
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    converter = make_converter(spec, headers, select)
+    keep = row_filter(where, headers, column_types(spec, headers))
+    records = []
+    errors = []
+    nrows = 0
+    for nrows, row in enumerate(split_csv(io.TextIOWrapper(io.BytesIO(data))), start=1):
+        try:
+            if keep is None or keep(row):
+                records.append(converter(headers, row))
+        except (ValueError, IndexError, TypeError) as e:
+            errors.append((nrows, row, e))
+    return records, nrows, errors
+
+def convert_csv_parallel(filename, make_converter, spec, *, headers=None, select=None,
+                         where=None, workers=None, errors=None, records=None):
+    '''
+    Convert a CSV file in a pool of worker processes. The file is split
+    into byte ranges on line boundaries and the records come back in
+    file order. Quoted fields must not contain newlines, and where
+    (if given) must be picklable.
+    '''
+    workers = workers or os.cpu_count()
+    with open(filename, 'rb') as file:
+        if headers is None:
+            headers = next(split_csv(io.TextIOWrapper(io.BytesIO(file.readline()))), None)
+            if headers is None:
+                return [] if records is None else records
+        start = file.tell()
+        end = file.seek(0, os.SEEK_END)
+        nchunks = workers * 4
+        if isinstance(records, SpillList):
+            # Records take roughly 10 times the bytes of their text. Keep
+            # the chunks in flight within about memory_limit between them.
+            chunk_size = max(records.memory_limit // (10 * 2 * workers), 1)
+            nchunks = max(nchunks, (end - start) // chunk_size)
+        ranges = csv_ranges(file, start, end, nchunks)
+
+    errors = bad_rows(errors, spec, headers, select)
+    if records is None:
+        records = []
+    rowno = 0
+
+    def collect(future):
+        nonlocal rowno
+        chunk, nrows, bad = future.result()
+        records.extend(chunk)
+        for n, row, e in bad:
+            errors.add(rowno + n, row, e)
+        rowno += nrows
+
+    # Only about two chunks per worker are in flight, so that only a few
+    # chunks of records are held here besides records itself
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(convert_csv_range, filename, start, end,
+                                       make_converter, spec, headers, select, where))
+            if len(pending) >= 2 * workers:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    errors.summary()
+    return records
+
+def select_columns(headers, names):
+    '''
+    Return the positions of the named columns in headers
+    '''
+    for name in names:
+        if name not in headers:
+            raise ValueError(f'No column {name!r} in {headers}')
+    return [ headers.index(name) for name in names ]
+
+def header_types(types, headers, columns=None):
+    '''
+    Line types up with headers.  types is either a list in column order
+    or a dict of types by column name, in which case its columns are the
+    ones kept (unless columns is given).  Returns the types and columns.
+    '''
+    if isinstance(types, dict):
+        if columns is None:
+            columns = list(types)
+        types = [ types.get(name, str) for name in headers ]
+    return types, columns
+
+def dict_converter(types, headers=None, columns=None):
+    types, columns = header_types(types, headers, columns)
+    if columns is None:
+        # Rows are indexed rather than zipped with headers, so that blank
+        # and short rows are bad rows, as they are for instances
+        columns = headers[:len(types)]
+        positions = range(len(columns))
+    else:
+        positions = select_columns(headers, columns)
+    funcs = [ types[n] for n in positions ]
+    return lambda headers, row: { name: func(row[n]) for name, func, n in zip(columns, funcs, positions) }
+
+def projected_class(cls, headers=None, fields=None):
+    '''
+    Return cls, or the projection of cls onto fields located by headers
+    '''
+    if fields is None:
+        return cls
+    return cls.project(fields, select_columns(headers, fields))
+
+def field_positions(cls, headers, fields=None):
+    '''
+    Return the position in headers of each field (of fields if given,
+    else of cls._fields), so that columns can be extra or reordered.
+    If headers doesn't name every field of cls, the fields are taken to
+    be the first columns, in order.
+    '''
+    if fields is not None:
+        return select_columns(headers, fields)
+    if headers is not None and set(cls._fields) <= set(headers):
+        return select_columns(headers, cls._fields)
+    return range(len(cls._fields))
+
+def instance_converter(cls, headers=None, fields=None):
+    if fields is None:
+        from_row = cls.from_row_at(field_positions(cls, headers))
+    else:
+        from_row = projected_class(cls, headers, fields).from_row
+    return lambda headers, row: from_row(row)
+
+def column_positions(headers, names, count):
+    '''
+    Return the positions of the named columns, or of the first count
+    columns if names is None
+    '''
+    return range(count) if names is None else select_columns(headers, names)
+
+def values_converter(cls, headers=None, fields=None, check=True):
+    '''
+    Make a converter that produces the field values of a row as a list
+    (for StructureTable), instead of an instance.  The values are checked
+    unless check is false, as when they go to StructureTable.append(),
+    which checks them itself.
+    '''
+    positions = field_positions(cls, headers, fields)
+    cls = projected_class(cls, headers, fields)
+    if not check:
+        return lambda headers, row: [ func(row[n]) for func, n in zip(cls._types, positions) ]
+    funcs = [ (func, getattr(cls, name).compiled_check) for name, func in zip(cls._fields, cls._types) ]
+    return lambda headers, row: [ check(func(row[n])) for (func, check), n in zip(funcs, positions) ]
+
+def column_types(spec, headers):
+    '''
+    Map column names to conversion functions, given either a Structure
+    class or a list of types that lines up with headers
+    '''
+    if isinstance(spec, type):
+        return dict(zip(spec._fields, spec._types))
+    return dict(zip(headers, header_types(spec, headers)[0]))
+
+def row_filter(where, headers, types, bytes_fields=False):
+    '''
+    Turn where, a function whose argument names are column names, into a
+    keep(row) test that only converts the columns that where asks for.
+    Returns None if where is None.
+    '''
+    if where is None:
+        return None
+    names = list(signature(where).parameters)
+    positions = select_columns(headers, names)
+    funcs = [ types.get(name, str) for name in names ]
+    if bytes_fields:
+        funcs = [ bytes_type(func) for func in funcs ]
+    return lambda row: where(*[ func(row[n]) for func, n in zip(funcs, positions) ])
+
+def row_diagnosis(spec, headers, names=None):
+    '''
+    Make a diagnose(row) function that finds the first of the columns
+    converted by spec that a bad row fails on.  Returns its position
+    and a BadRows reason code.  Only used on rows that already failed.
+    '''
+    if isinstance(spec, type):
+        positions = field_positions(spec, headers, names)
+        checks = [ (func, getattr(spec, name).compiled_check)
+                   for name, func in zip(spec._fields, spec._types) ]
+        if names is not None:
+            checks = [ checks[spec._fields.index(name)] for name in names ]
+    else:
+        spec, names = header_types(spec, headers, names)
+        positions = column_positions(headers, names, len(spec))
+        checks = [ (spec[n], None) for n in positions ]
+
+    def diagnose(row):
+        if isinstance(row, str):
+            # A line that couldn't even be split into fields (bad JSON)
+            return -1, BadRows.OTHER
+        for n, (func, check) in zip(positions, checks):
+            if n >= len(row):
+                return n, BadRows.MISSING
+            try:
+                value = func(row[n])
+            except (ValueError, TypeError):
+                return n, BadRows.MISSING if not row[n] else BadRows.TYPE
+            try:
+                if check:
+                    check(value)
+            except (ValueError, TypeError):
+                return n, BadRows.CHECK
+        return -1, BadRows.OTHER
+    return diagnose
+
+def bad_rows(errors, spec, headers, names=None):
+    '''
+    Return errors (or a new BadRows if it's None) set up to report the
+    columns at fault in rows with the given headers
+    '''
+    if errors is None:
+        errors = BadRows()
+    errors.headers = headers
+    errors.diagnose = row_diagnosis(spec, headers, names)
+    return errors
+
+def csv_headers(rows, headers):
+    '''
+    Return headers, or read them from the first row.  Returns None if
+    there isn't one (the file is empty).
+    '''
+    if headers is None:
+        headers = next(rows, None)
+    return headers
+
+def decode_field(val):
+    '''
+    Decode a raw bytes field, removing its quotes (and unescaping doubled
+    quotes) if it's quoted
+    '''
+    if val[:1] == b'"':
+        val = val[1:-1].replace(b'""', b'"')
+    return val.decode('utf-8')
+
+def bytes_type(func):
+    '''
+    Adapt a conversion function to a raw bytes field
+    '''
+    if func in (int, float):
+        return func
+    elif func is str:
+        return decode_field
+    else:
+        return lambda val: func(decode_field(val))
+
+def bytes_converter(converter, positions, types):
+    '''
+    Adapt a row converter to rows of raw bytes fields. Only the columns
+    at positions are used and, since int() and float() accept bytes as
+    they are, only the ones of other types get decoded.
+    '''
+    decoded = [ n for n, func in zip(positions, types) if func not in (int, float) ]
+    def convert(headers, row):
+        for n in decoded:
+            row[n] = decode_field(row[n])
+        return converter(headers, row)
+    return convert
+
+# A quoted field holding a comma, which splitting on commas would break up
+_quoted_comma = re.compile(rb'(?:^|,)"[^"\n,]*(?:""[^"\n,]*)*,')
+
+def split_line(line):
+    '''
+    Split a line of bytes into raw bytes fields.  Lines with commas in
+    quoted fields are split by csv.reader(), and their fields come back
+    unquoted, unless decode_field() would take them for quoted ones.
+    '''
+    if not line:
+        return []
+    if b'"' not in line or not _quoted_comma.search(line):
+        return line.split(b',')
+    fields = next(csv.reader([line.decode('utf-8')]), [])
+    return [ ('"%s"' % val.replace('"', '""') if val[:1] == '"' else val).encode('utf-8')
+             for val in fields ]
+
+def mmap_rows(file, block_size=1 << 16):
+    '''
+    Generate rows of raw bytes fields from a memory mapped file.  The file
+    is split into lines about block_size bytes at a time, and the lines
+    are split on commas.  A line with a different number of fields than
+    the first one is split again with split_line(), in case its quoted
+    fields hold commas.  Quoted fields can't contain newlines.
+    '''
+    if compression(file.name):
+        raise ValueError(f"Can't memory map compressed file {file.name}")
+    if os.fstat(file.fileno()).st_size == 0:
+        return
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start, size = 0, len(mm)
+        width = None
+        while start < size:
+            end = mm.rfind(b'\n', start, start + block_size) + 1
+            if end <= start:
+                # A line longer than block_size, or a last line without a newline
+                end = mm.find(b'\n', start + block_size) + 1 or size
+            block = mm[start:end]
+            start = end
+            if b'\r' in block:
+                block = block.replace(b'\r\n', b'\n')
+            lines = block.split(b'\n')
+            if block.endswith(b'\n'):
+                lines.pop()
+            if width is None:
+                width = len(split_line(lines[0]))
+            if b'"' in block and b'""' not in block:
+                # No escaped quotes, so all quotes can be dropped at once
+                # rather than field by field
+                unquoted = block.replace(b'"', b'').split(b'\n')
+            else:
+                unquoted = lines
+            for line, plain in zip(lines, unquoted):
+                row = plain.split(b',')
+                yield row if len(row) == width and line else split_line(line)
+
+def mmap_headers(rows, headers):
+    if headers is None:
+        headers = [ decode_field(val) for val in next(rows, []) ]
+    return headers
+
+def func_key(func):
+    '''
+    Describe a conversion function for cache keys.  Functions are
+    described by their code, constants and closure values as well as
+    their name, since lambdas all share one name.  Returns None if func
+    can't be described reliably (the description would hold an address).
+    '''
+    code = getattr(func, '__code__', None)
+    if code is None:
+        key = (getattr(func, '__module__', None), getattr(func, '__qualname__', None) or repr(func))
+    else:
+        values = [ cell.cell_contents for cell in func.__closure__ or () ]
+        values += func.__defaults__ or ()
+        values = tuple(func_key(val) if callable(val) else val for val in values)
+        if None in values:
+            return None
+        consts = tuple(c.co_code if isinstance(c, CodeType) else c for c in code.co_consts)
+        key = (func.__module__, func.__qualname__, code.co_code, consts, code.co_names, values)
+    return None if ' at 0x' in repr(key) else key
+
+def schema_key(spec):
+    '''
+    Describe a Structure class, or a list of types, for cache keys.
+    Returns None if one of the conversion functions can't be described.
+    '''
+    if isinstance(spec, type):
+        funcs = spec._types
+        key = (spec.__module__, spec.__qualname__, spec._fields,
+               tuple(type(getattr(spec, name)).__qualname__ for name in spec._fields))
+    elif isinstance(spec, dict):
+        funcs = spec.values()
+        key = tuple(spec)
+    else:
+        funcs = spec
+        key = ()
+    funcs = tuple(map(func_key, funcs))
+    return None if None in funcs else (key, funcs)
+
+def cache_path(filename, cache, key):
+    '''
+    Return the cache file for filename and key.  cache is either True
+    (next to filename) or the name of a cache directory.
+    '''
+    directory = os.path.dirname(filename) if cache is True else cache
+    if cache is not True:
+        os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, f'{os.path.basename(filename)}.{digest}.cache')
+
+def cached(filename, cache, key, load):
+    '''
+    Return load(), reusing a pickled copy of its result from an earlier
+    call with the same key.  The copy is only used if filename still has
+    the same modification time and size as when it was made.  Nothing is
+    cached if the schema in key (key[1], from schema_key()) is None, or if
+    the result can't be pickled or written.
+    '''
+    if key[1] is None:
+        log.debug('Not caching %s: conversion functions have no stable key', filename)
+        return load()
+    st = os.stat(filename)
+    stamp = (st.st_mtime_ns, st.st_size)
+    path = cache_path(filename, cache, key)
+    try:
+        with open(path, 'rb') as file:
+            if pickle.load(file) == stamp:
+                return pickle.load(file)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.debug('Ignoring cache %s: %s', path, e)
+
+    records = load()
+    tmpname = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmpname, 'wb') as file:
+            pickle.dump(stamp, file)
+            pickle.dump(records, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, path)
+    except Exception as e:
+        log.debug("Can't cache %s in %s: %s", filename, path, e)
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
     return records
 
-def csv_as_dicts(lines, types, *, headers=None):
-    return convert_csv(lines, 
-                       lambda headers, row: { name: func(val) for name, func, val in zip(headers, types, row) })
+def csv_as_dicts(lines, types, *, headers=None, columns=None, where=None, errors=None,
+                 records=None):
+    rows = split_csv(lines)
+    headers = csv_headers(rows, headers)
+    if headers is None:
+        return [] if records is None else records
+    return convert_rows(rows, dict_converter(types, headers, columns), headers=headers,
+                        records=records,
+                        keep=row_filter(where, headers, column_types(types, headers)),
+                        errors=bad_rows(errors, types, headers, columns))
+
+def csv_as_instances(lines, cls, *, headers=None, fields=None, where=None, errors=None,
+                     records=None):
+    rows = split_csv(lines)
+    headers = csv_headers(rows, headers)
+    if headers is None:
+        return [] if records is None else records
+    return convert_rows(rows, instance_converter(cls, headers, fields), headers=headers,
+                        records=records,
+                        keep=row_filter(where, headers, column_types(cls, headers)),
+                        errors=bad_rows(errors, cls, headers, fields))
+
+def csv_as_table(lines, cls, *, headers=None, fields=None, where=None, errors=None):
+    rows = split_csv(lines)
+    headers = csv_headers(rows, headers)
+    if headers is None:
+        return StructureTable(cls if fields is None else cls.project(fields))
+    return convert_rows(rows, values_converter(cls, headers, fields, check=False), headers=headers,
+                        records=StructureTable(projected_class(cls, headers, fields)),
+                        keep=row_filter(where, headers, column_types(cls, headers)),
+                        errors=bad_rows(errors, cls, headers, fields))
+
+def read_csv_as_dicts(filename, types, *, headers=None, columns=None, where=None, workers=None,
+                      cache=None, threaded=False, errors=None, memory_limit=None):
+    '''
+    Read CSV data into a list of dictionaries with optional type conversion.
+    types is a list that lines up with the columns, or a dict of types by
+    column name (which only keeps those columns, wherever they are).
+    If columns is given, only those columns are converted and kept.
+    If where is given, only rows for which where(**values) is true are
+    kept, where values holds just the columns named by its arguments.
+    If workers is given, the file is converted by that many processes.
+    If cache is given (True or a directory), the result is cached in a
+    binary file that is used until the CSV file changes. Not used with where.
+    gzip, bz2 and xz files are decompressed as they are read (serially,
+    in a background thread if threaded is true).
+    If errors (a BadRows) is given, the bad rows are reported in it.
+    If memory_limit is given, records beyond about that many bytes are
+    spilled to a temporary file and read back lazily (see SpillList).
+    Neither is used with cache.
+    '''
+    if cache and where is None and errors is None and memory_limit is None:
+        return cached(filename, cache, ('dicts', schema_key(types), headers, columns),
+                      lambda: read_csv_as_dicts(filename, types, headers=headers, columns=columns,
+                                                workers=workers, threaded=threaded))
+    records = SpillList(memory_limit) if memory_limit else None
+    if workers and not compression(filename):
+        return convert_csv_parallel(filename, dict_converter, types, headers=headers,
+                                    select=columns, where=where, workers=workers, errors=errors,
+                                    records=records)
+    with open_text(filename, threaded=threaded) as file:
+        return csv_as_dicts(file, types, headers=headers, columns=columns, where=where,
+                            errors=errors, records=records)
+
+def read_csv_as_instances(filename, cls, *, headers=None, fields=None, where=None, workers=None,
+                          cache=None, threaded=False, errors=None, memory_limit=None):
+    '''
+    Read CSV data into a list of instances.
+    Fields are found by header name, so files can have extra columns or
+    columns in another order.  The positions are worked out once per file.
+    If fields is given, the instances only hold (and convert) those fields.
+    If where is given, only rows for which where(**values) is true are
+    kept, where values holds just the columns named by its arguments.
+    If workers is given, the file is converted by that many processes.
+    If cache is given (True or a directory), the result is cached in a
+    binary file that is used until the CSV file or cls changes. Not used with where.
+    gzip, bz2 and xz files are decompressed as they are read (serially,
+    in a background thread if threaded is true).
+    If errors (a BadRows) is given, the bad rows are reported in it.
+    If memory_limit is given, records beyond about that many bytes are
+    spilled to a temporary file and read back lazily (see SpillList).
+    Neither is used with cache.
+    '''
+    if cache and where is None and errors is None and memory_limit is None:
+        return cached(filename, cache, ('instances', schema_key(cls), headers, fields),
+                      lambda: read_csv_as_instances(filename, cls, headers=headers, fields=fields,
+                                                    workers=workers, threaded=threaded))
+    records = SpillList(memory_limit) if memory_limit else None
+    if workers and not compression(filename):
+        return convert_csv_parallel(filename, instance_converter, cls, headers=headers,
+                                    select=fields, where=where, workers=workers, errors=errors,
+                                    records=records)
+    with open_text(filename, threaded=threaded) as file:
+        return csv_as_instances(file, cls, headers=headers, fields=fields, where=where,
+                                errors=errors, records=records)
+
+def read_csv_as_table(filename, cls, *, headers=None, fields=None, where=None, cache=None,
+                      threaded=False, errors=None):
+    '''
+    Read CSV data into a column oriented StructureTable.
+    cache, threaded and errors work as for read_csv_as_instances().
+    '''
+    if cache and where is None and errors is None:
+        return cached(filename, cache, ('table', schema_key(cls), headers, fields),
+                      lambda: read_csv_as_table(filename, cls, headers=headers, fields=fields,
+                                                threaded=threaded))
+    with open_text(filename, threaded=threaded) as file:
+        return csv_as_table(file, cls, headers=headers, fields=fields, where=where, errors=errors)
+
+def iter_csv_as_dicts(filename, types, *, headers=None, columns=None, where=None, threaded=False,
+                      errors=None):
+    '''
+    Lazily read CSV data as a sequence of dictionaries
+    '''
+    with open_text(filename, threaded=threaded) as file:
+        rows = split_csv(file)
+        headers = csv_headers(rows, headers)
+        if headers is None:
+            return
+        yield from iter_convert_rows(rows, dict_converter(types, headers, columns), headers=headers,
+                                     keep=row_filter(where, headers, column_types(types, headers)),
+                                     errors=bad_rows(errors, types, headers, columns))
+
+def iter_csv_as_instances(filename, cls, *, headers=None, fields=None, where=None, threaded=False,
+                          errors=None):
+    '''
+    Lazily read CSV data as a sequence of instances
+    '''
+    with open_text(filename, threaded=threaded) as file:
+        rows = split_csv(file)
+        headers = csv_headers(rows, headers)
+        if headers is None:
+            return
+        yield from iter_convert_rows(rows, instance_converter(cls, headers, fields), headers=headers,
+                                     keep=row_filter(where, headers, column_types(cls, headers)),
+                                     errors=bad_rows(errors, cls, headers, fields))
+
+def iter_csv_batches(filename, cls, *, batch_size=1000, columnar=False, headers=None,
+                     fields=None, where=None, threaded=False, errors=None):
+    '''
+    Lazily read CSV data as lists of up to batch_size instances, or as
+    StructureTables of up to batch_size records if columnar is true.
+    Only one batch is held in memory at a time.
+    '''
+    with open_text(filename, threaded=threaded) as file:
+        rows = split_csv(file)
+        headers = csv_headers(rows, headers)
+        if headers is None:
+            return
+        if columnar:
+            # The values are already checked, so they go straight into the columns
+            converter = values_converter(cls, headers, fields)
+            def make_batch(records):
+                table = StructureTable(projected_class(cls, headers, fields))
+                table.extend_columns(zip(*records))
+                return table
+        else:
+            converter = instance_converter(cls, headers, fields)
+            make_batch = list
+        records = iter_convert_rows(rows, converter, headers=headers,
+                                    keep=row_filter(where, headers, column_types(cls, headers)),
+                                    errors=bad_rows(errors, cls, headers, fields))
+        while True:
+            batch = make_batch(islice(records, batch_size))
+            if not batch:
+                break
+            yield batch
+
+def read_mmap_as_dicts(filename, types, *, headers=None, columns=None, where=None, errors=None):
+    '''
+    Read plain CSV data into a list of dictionaries through a memory
+    mapping of the file, decoding only the non-numeric columns
+    '''
+    with open(filename, 'rb') as file:
+        rows = mmap_rows(file)
+        headers = mmap_headers(rows, headers)
+        types, columns = header_types(types, headers, columns)
+        positions = column_positions(headers, columns, len(types))
+        return convert_rows(rows, bytes_converter(dict_converter(types, headers, columns),
+                                                  positions, [ types[n] for n in positions ]),
+                            headers=headers,
+                            keep=row_filter(where, headers, column_types(types, headers), bytes_fields=True),
+                            errors=bad_rows(errors, types, headers, columns))
+
+def read_mmap_as_instances(filename, cls, *, headers=None, fields=None, where=None, errors=None):
+    '''
+    Read plain CSV data into a list of instances through a memory
+    mapping of the file, decoding only the non-numeric columns
+    '''
+    with open(filename, 'rb') as file:
+        rows = mmap_rows(file)
+        headers = mmap_headers(rows, headers)
+        positions = field_positions(cls, headers, fields)
+        return convert_rows(rows, bytes_converter(instance_converter(cls, headers, fields),
+                                                  positions, projected_class(cls, headers, fields)._types),
+                            headers=headers,
+                            keep=row_filter(where, headers, column_types(cls, headers), bytes_fields=True),
+                            errors=bad_rows(errors, cls, headers, fields))
+
+def csv_files(pattern):
+    '''
+    Return the sorted names of the files matching a glob pattern, or of
+    the files in a directory
+    '''
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*')
+    return sorted(name for name in glob.glob(pattern) if os.path.isfile(name))
 
-def csv_as_instances(lines, cls, *, headers=None):
-    return convert_csv(lines,
-                       lambda headers, row: cls.from_row(row))
+def read_file_as_table(filename, cls, headers, fields, where):
+    '''
+    Read one file for read_many().  Runs in a worker, so the bad rows
+    are returned instead of logged.
+    '''
+    errors = BadRows(log_limit=None)
+    table = read_csv_as_table(filename, cls, headers=headers, fields=fields, where=where,
+                              errors=errors)
+    return table, errors
+
+def read_tables(filenames, cls, errors, *, workers, processes, headers, fields, where):
+    '''
+    Read files into StructureTables in a pool of worker processes (or
+    threads) and produce the tables in file order.  Only about two files
+    per worker are in flight at a time.  Bad rows and files that can't
+    be read are logged and recorded in errors by filename.  Failures
+    that aren't down to a file (a task that can't be pickled, a broken
+    pool) are raised.
+    '''
+    if processes:
+        # Fails here, rather than once for every file
+        pickle.dumps((cls, headers, fields, where))
+
+    def result(filename, future):
+        try:
+            table, bad = future.result()
+        except (BrokenExecutor, pickle.PicklingError):
+            raise
+        except Exception as e:
+            log.error('%s: %r', filename, e)
+            errors[filename] = e
+            return None
+        if bad:
+            log.warning('%s: %d bad rows (%s)', filename, len(bad), bad.describe())
+            errors[filename] = bad
+        return table
+
+    pool_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool_type(workers) as pool:
+        pending = deque()
+        for filename in filenames:
+            pending.append((filename, pool.submit(read_file_as_table, filename, cls,
+                                                  headers, fields, where)))
+            if len(pending) >= 2 * workers:
+                table = result(*pending.popleft())
+                if table is not None:
+                    yield table
+        while pending:
+            table = result(*pending.popleft())
+            if table is not None:
+                yield table
+
+def read_many(pattern, cls, *, workers=None, processes=None, stream=False, errors=None,
+              headers=None, fields=None, where=None):
+    '''
+    Read all the CSV files matching a glob pattern, or in a directory,
+    in a pool of workers.  Returns a StructureTable of all the records
+    in file order or, if stream is true, an iterator over them that only
+    holds a few files in memory at a time.  The workers are processes,
+    unless processes is false or every file is compressed (decompression
+    runs in parallel in threads).  Bad rows and files that can't be read
+    are logged per file and, if errors is a dict, recorded in it by
+    filename, as a BadRows or the exception.  where must be picklable.
+    '''
+    filenames = csv_files(pattern)
+    workers = workers or os.cpu_count()
+    if processes is None:
+        processes = not all(compression(name) for name in filenames)
+    if errors is None:
+        errors = { }
+    tables = read_tables(filenames, cls, errors, workers=workers, processes=processes,
+                         headers=headers, fields=fields, where=where)
+    if stream:
+        return chain.from_iterable(tables)
+    merged = StructureTable(cls if fields is None else cls.project(fields))
+    for table in tables:
+        merged.extend_columns(table.columns.values())
+    return merged
 
-def read_csv_as_dicts(filename, types, *, headers=None):
+def field_slices(widths):
     '''
-    Read CSV data into a list of dictionaries with optional type conversion
+    Turn the widths of fixed width fields into slices of a line
     '''
-    with open(filename) as file:
-        return csv_as_dicts(file, types, headers=headers)
+    offsets = list(accumulate(widths, initial=0))
+    return [ slice(start, end) for start, end in zip(offsets, offsets[1:]) ]
+
+def dat_splitter(slices=None):
+    '''
+    Return a function that splits a line into whitespace separated
+    fields, or into fixed width fields if slices is given
+    '''
+    if slices is None:
+        return str.split
+    return lambda line: [ line[s].strip() for s in slices ]
+
+def dat_columns(lines, ncols, slices=None):
+    '''
+    Split a block of lines into ncols columns of fields, skipping blank
+    lines.  Whitespace separated lines are split all at once, with a NUL
+    field marking the end of each line, so a line with the wrong number
+    of fields shows up as a misplaced marker.  Raises ValueError if so.
+    '''
+    lines = list(filter(str.strip, lines))
+    if slices is not None:
+        return [ list(map(str.strip, [ line[s] for line in lines ])) for s in slices ]
+    text = ''.join(lines)
+    if not text.endswith('\n'):
+        text += '\n'
+    fields = text.replace('\n', ' \0\n').split()
+    if (len(fields) != (ncols + 1) * len(lines) or
+        fields[ncols::ncols + 1].count('\0') != len(lines)):
+        raise ValueError(f'expected {ncols} fields')
+    return [ fields[n::ncols + 1] for n in range(ncols) ]
+
+def convert_column(func, values):
+    '''
+    Convert a whole column of fields with func.  int and float columns
+    become arrays.
+    '''
+    if func is int:
+        return array('q', map(int, values))
+    elif func is float:
+        return array('d', map(float, values))
+    return list(map(func, values))
+
+def read_dat_as_table(filename, cls, *, widths=None, block_size=1 << 20, errors=None,
+                      threaded=False):
+    '''
+    Read whitespace separated data (or fixed width data, given the widths
+    of the fields) into a StructureTable.  The columns must be in the
+    order of cls._fields.  Lines are split, converted and checked in
+    blocks of about block_size bytes, a column at a time.  A block with
+    bad lines is redone line by line, and the bad lines are reported as
+    for read_csv_as_instances().
+    '''
+    if widths is not None and len(widths) != len(cls._fields):
+        raise ValueError(f'Expected {len(cls._fields)} widths')
+    slices = None if widths is None else field_slices(widths)
+    split = dat_splitter(slices)
+    funcs = cls._types
+    checks = [ column_check(getattr(cls, name)) for name in cls._fields ]
+    errors = bad_rows(errors, cls, list(cls._fields))
+    table = StructureTable(cls)
+    rowno = 0
+    with open_text(filename, threaded=threaded) as file:
+        while True:
+            lines = file.readlines(block_size)
+            if not lines:
+                break
+            try:
+                columns = [ convert_column(func, values)
+                            for func, values in zip(funcs, dat_columns(lines, len(funcs), slices)) ]
+                for check, values in zip(checks, columns):
+                    check(values)
+            except (ValueError, TypeError, OverflowError):
+                for rowno, line in enumerate(lines, start=rowno + 1):
+                    if line.strip():
+                        row = split(line)
+                        try:
+                            if len(row) != len(funcs):
+                                raise ValueError(f'expected {len(funcs)} fields')
+                            table.append([ func(val) for func, val in zip(funcs, row) ])
+                        except ValueError as e:
+                            errors.add(rowno, row, e)
+            else:
+                table.extend_columns(columns)
+                rowno += len(lines)
+    errors.summary()
+    return table
+
+def identifier(name):
+    '''
+    Turn a column (or file) name into a usable Python identifier
+    '''
+    name = re.sub(r'\W', '_', name)
+    if not name.isidentifier() or iskeyword(name) or name.startswith('_'):
+        name = 'f_' + name
+    return name
+
+def unique_identifiers(names):
+    '''
+    Turn names into identifiers (see identifier()), numbering any that
+    come out the same, as "a b" and "a_b" do
+    '''
+    idents = [ ]
+    for name in names:
+        ident = base = identifier(name)
+        n = 1
+        while ident in idents:
+            n += 1
+            ident = f'{base}_{n}'
+        idents.append(ident)
+    return idents
+
+def infer_validator(values):
+    '''
+    Pick the narrowest validator that fits a column of sample values.
+    Missing values (see validate.missing_values) are set aside, and if
+    there are any, the validator is a nullable one.  Strings that repeat
+    a lot are interned.
+    '''
+    present = [ val for val in values if val not in missing_values ]
+    missing = len(present) < len(values)
+    for validator, nullable_validator, func in [ (Integer, NullableInteger, int),
+                                                 (Float, NullableFloat, float) ]:
+        try:
+            for val in present:
+                func(val)
+            if present:
+                return nullable_validator() if missing else validator()
+        except ValueError:
+            pass
+    if missing:
+        return NullableString()
+    if len(set(present)) <= len(present) // 2:
+        return InternedString()
+    return String()
 
-def read_csv_as_instances(filename, cls, *, headers=None):
+def infer_structure(filename, *, sample_rows=1000, clsname=None, headers=None):
     '''
-    Read CSV data into a list of instances
+    Make a Structure class for a CSV file from its headers and the
+    types of the values in its first sample_rows rows
     '''
-    with open(filename) as file:
-        return csv_as_instances(file, cls, headers=headers)
+    with open_text(filename) as file:
+        rows = split_csv(file)
+        headers = csv_headers(rows, headers)
+        if headers is None:
+            raise ValueError(f'{filename} is empty')
+        sample = [ row for row in islice(rows, sample_rows) if row ]
 
+    if clsname is None:
+        clsname = os.path.basename(filename).split('.')[0].title()
+    # Short rows are padded with empty (missing) values
+    columns = [ [ row[n] if n < len(row) else '' for row in sample ]
+                for n in range(len(headers)) ]
+    validators = dict(zip(unique_identifiers(headers), map(infer_validator, columns)))
+    return typed_structure(identifier(clsname), **validators)
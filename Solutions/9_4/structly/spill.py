@@ -0,0 +1,106 @@
+# spill.py
+
+from bisect import bisect_right
+import collections.abc
+import pickle
+import sys
+import tempfile
+
+def record_size(record):
+    '''
+    Estimate the memory used by a record (a dict or an instance), its
+    values and its place in a list
+    '''
+    size = sys.getsizeof(record) + 8
+    if isinstance(record, dict):
+        values = record.values()
+    else:
+        values = record
+        if hasattr(record, '__dict__'):
+            size += sys.getsizeof(vars(record))
+    return size + sum(map(sys.getsizeof, values))
+
+class SpillList(collections.abc.Sequence):
+    '''
+    List of records that holds about memory_limit bytes of them in
+    memory.  Beyond that, records are pickled in segments to a temporary
+    file, and read back a segment at a time when they are used.
+    '''
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+        self.segment_size = None
+        self.records = []
+        self.file = None
+        self.offsets = []
+        self.starts = []
+        self.nspilled = 0
+        self.loaded = (None, None)
+
+    def __len__(self):
+        return self.nspilled + len(self.records)
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [ self[i] for i in range(*n.indices(len(self))) ]
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError('SpillList index out of range')
+        if n >= self.nspilled:
+            return self.records[n - self.nspilled]
+        segno = bisect_right(self.starts, n) - 1
+        return self.segment(segno)[n - self.starts[segno]]
+
+    def __iter__(self):
+        for segno in range(len(self.offsets)):
+            yield from self.segment(segno)
+        yield from self.records
+
+    def __repr__(self):
+        return '%s(<%d records, %d spilled>)' % (type(self).__name__, len(self), self.nspilled)
+
+    def __reduce__(self):
+        # Pickled as a plain list of all the records
+        return (list, (list(self),))
+
+    def segment(self, segno):
+        '''
+        Return the records of a spilled segment, keeping the last one used
+        '''
+        if self.loaded[0] != segno:
+            self.file.seek(self.offsets[segno])
+            self.loaded = (segno, pickle.load(self.file))
+        return self.loaded[1]
+
+    def append(self, record):
+        if self.segment_size is None:
+            self.segment_size = max(1, self.memory_limit // record_size(record))
+        self.records.append(record)
+        if len(self.records) >= self.segment_size:
+            self.spill()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def spill(self):
+        '''
+        Write the records held in memory to a new segment
+        '''
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        self.offsets.append(self.file.seek(0, 2))
+        self.starts.append(self.nspilled)
+        pickle.dump(self.records, self.file, pickle.HIGHEST_PROTOCOL)
+        self.nspilled += len(self.records)
+        self.records = []
+
+    def close(self):
+        '''
+        Remove the temporary file.  The spilled records are lost.
+        '''
+        if self.file is not None:
+            self.file.close()
+
+    def __del__(self):
+        self.close()
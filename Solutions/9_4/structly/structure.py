@@ -1,21 +1,61 @@
 # structure.py
 
-__all__ = [ 'Structure' ]
+__all__ = [ 'Structure', 'Missing' ]
 
-from .validate import Validator, validated
+from .validate import Validator, validated, Missing
 from collections import ChainMap
+import copyreg
+from inspect import getattr_static
 
 class StructureMeta(type):
     @classmethod
-    def __prepare__(meta, clsname, bases):
+    def __prepare__(meta, clsname, bases, **kwargs):
         return ChainMap({}, Validator.validators)
         
     @staticmethod
-    def __new__(meta, name, bases, methods):
-        methods = methods.maps[0]
+    def __new__(meta, name, bases, methods, *, slots=False):
+        if isinstance(methods, ChainMap):
+            methods = methods.maps[0]
+        if slots:
+            # Reserve a private slot for each validated field
+            methods['__slots__'] = tuple(f'_{key}' for key, val in methods.items()
+                                         if isinstance(val, Validator))
         return super().__new__(meta, name, bases, methods)
 
+class SlotField:
+    '''
+    Descriptor that validates values with a Validator and stores
+    them in a __slots__ member instead of the instance dictionary
+    '''
+    __slots__ = ('validator', 'slot')
+
+    def __init__(self, validator, slot):
+        self.validator = validator
+        self.slot = slot
+
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self.validator
+        return self.slot.__get__(instance, cls)
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, self.validator.compiled_check(value))
+
+class Unprojected:
+    '''
+    Descriptor for a field that a projection leaves out, so that it
+    can't be found on the parent class instead
+    '''
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, cls):
+        raise AttributeError(f'{cls.__name__!r} projection has no field {self.name!r}')
+
 class Structure(metaclass=StructureMeta):
+    __slots__ = ()
     _fields = ()
     _types = ()
 
@@ -41,24 +81,143 @@ class Structure(metaclass=StructureMeta):
         rowdata = [ func(val) for func, val in zip(cls._types, row) ]
         return cls(*rowdata)
 
+    @classmethod
+    def from_rows(cls, rows):
+        return [ cls.from_row(row) for row in rows ]
+
+    @classmethod
+    def store_fields(cls, env, values):
+        '''
+        Return lines of code that check each value expression in values
+        with the compiled check of its field and store the result
+        directly in the instance dict (or slot) of self
+        '''
+        lines = [ ]
+        for name, value in zip(cls._fields, values):
+            env[f'_check_{name}'] = getattr(cls, name).compiled_check
+            value = f'_check_{name}({value})'
+            field = getattr_static(cls, name)
+            if isinstance(field, SlotField):
+                env[f'_set_{name}'] = field.slot.__set__
+                lines.append(f'_set_{name}(self, {value})')
+            else:
+                lines.append(f'_d[{name!r}] = {value}')
+        if any(line.startswith('_d[') for line in lines):
+            lines.insert(0, '_d = self.__dict__')
+        return lines
+
     @classmethod
     def create_init(cls):
         '''
         Create an __init__ method from _fields
         '''
+        env = { }
         args = ','.join(cls._fields)
         code = f'def __init__(self, {args}):\n'
-        for name in cls._fields:
-            code += f'    self.{name} = {name}\n'
-        locs = { }
-        exec(code, locs)
-        cls.__init__ = locs['__init__']
+        for line in cls.store_fields(env, cls._fields):
+            code += f'    {line}\n'
+        exec(code, env)
+        cls.__init__ = env['__init__']
+
+    @classmethod
+    def make_from_row(cls, positions=None):
+        '''
+        Make from_row(cls, row) and from_rows(cls, rows) functions from
+        _fields and _types. The conversions and checks are unrolled and
+        the values are stored directly, bypassing __init__ and __setattr__.
+        positions gives the index of each field in a row (by default, the
+        order of _fields), or its key if rows are dicts.
+        '''
+        if positions is None:
+            positions = range(len(cls._fields))
+        env = { '_new': object.__new__ }
+        values = [ ]
+        for name, func, n in zip(cls._fields, cls._types, positions):
+            env[f'_type_{name}'] = func
+            values.append(f'_type_{name}(row[{n!r}])')
+        lines = [ 'self = _new(cls)', *cls.store_fields(env, values) ]
+
+        code = 'def from_row(cls, row):\n'
+        code += ''.join(f'    {line}\n' for line in lines)
+        code += '    return self\n'
+        code += 'def from_rows(cls, rows):\n'
+        code += '    records = []\n'
+        code += '    append = records.append\n'
+        code += '    for row in rows:\n'
+        code += ''.join(f'        {line}\n' for line in lines)
+        code += '        append(self)\n'
+        code += '    return records\n'
+        exec(code, env)
+        return env['from_row'], env['from_rows']
+
+    @classmethod
+    def create_from_row(cls, positions=None):
+        '''
+        Create from_row() and from_rows() methods (see make_from_row())
+        '''
+        from_row, from_rows = cls.make_from_row(positions)
+        cls.from_row = classmethod(from_row)
+        cls.from_rows = classmethod(from_rows)
+
+    @classmethod
+    def from_row_at(cls, positions):
+        '''
+        Return a from_row(row) function for rows that hold the fields at
+        the given positions, such as rows with extra or reordered columns.
+        Positions can also be the keys of dict rows.  Functions are cached.
+        '''
+        positions = tuple(positions)
+        if positions == tuple(range(len(cls._fields))):
+            return cls.from_row
+        readers = cls.__dict__.get('_row_readers')
+        if readers is None:
+            readers = cls._row_readers = { }
+        if positions not in readers:
+            readers[positions] = cls.make_from_row(positions)[0].__get__(cls)
+        return readers[positions]
+
+    @classmethod
+    def project(cls, fields, positions=None):
+        '''
+        Return a subclass that only holds the given fields.  Its from_row()
+        takes full rows and converts just those fields, found at positions
+        (by default, where they sit in _fields).  Subclasses are cached.
+        '''
+        fields = tuple(fields)
+        if positions is None:
+            positions = [ cls._fields.index(name) for name in fields ]
+        key = (fields, tuple(positions))
+        projections = cls.__dict__.get('_projections')
+        if projections is None:
+            projections = cls._projections = { }
+        if key not in projections:
+            # Projections can't be found by name, so pickle them by recipe
+            reduce = lambda self: (rebuild_projection, (cls, *key, tuple(self)))
+            methods = { name: Unprojected(name) for name in cls._fields if name not in fields }
+            subcls = type(cls.__name__, (cls,), { **methods, '__slots__': (), '__reduce__': reduce })
+            subcls._fields = fields
+            subcls._types = tuple(cls._types[cls._fields.index(name)] for name in fields)
+            subcls.create_init()
+            subcls.create_from_row(positions)
+            subcls._recipe = (cls.project, key)
+            projections[key] = subcls
+        return projections[key]
 
     @classmethod
     def __init_subclass__(cls):
         # Apply the validated decorator to subclasses
         validate_attributes(cls)
 
+def rebuild_projection(cls, fields, positions, values):
+    return cls.project(fields, positions)(*values)
+
+def reduce_structure_class(cls):
+    # Classes that can't be found by name (projections and typed
+    # structures) are pickled by recipe, other classes by name
+    return cls.__dict__.get('_recipe', cls.__qualname__)
+
+copyreg.pickle(StructureMeta, reduce_structure_class)
+
 def validate_attributes(cls):
     '''
     Class decorator that scans a class definition for Validators
@@ -76,18 +235,42 @@ def validate_attributes(cls):
     # Collect all of the field names
     cls._fields = tuple([v.name for v in validators])
 
-    # Collect type conversions. The lambda x:x is an identity
-    # function that's used in case no expected_type is found.
-    cls._types = tuple([ getattr(v, 'expected_type', lambda x: x)
+    # Slotted classes (class Name(Structure, slots=True)) store
+    # validated values in their reserved slots
+    slots = vars(cls).get('__slots__', ())
+    for v in validators:
+        if f'_{v.name}' in slots:
+            setattr(cls, v.name, SlotField(v, vars(cls)[f'_{v.name}']))
+
+    # Collect type conversions. A validator's convert function is used
+    # if it has one.  The lambda x:x is an identity function that's
+    # used in case no expected_type is found either.
+    cls._types = tuple([ getattr(v, 'convert', getattr(v, 'expected_type', lambda x: x))
                    for v in validators ])
 
-    # Create the __init__ method
+    # Create the __init__ and from_row methods
     if cls._fields:
         cls.create_init()
+        if 'from_row' not in vars(cls):
+            cls.create_from_row()
 
     
     return cls
 
+_typed_structures = { }
+
 def typed_structure(clsname, **validators):
-    cls = type(clsname, (Structure,), validators)
-    return cls
+    '''
+    Make a Structure class with the given validators as its fields.  The
+    validators are plain ones (Integer(), String() and so on), so classes
+    are cached by name and validator types, and pickled by that recipe.
+    '''
+    key = (clsname, tuple((name, type(val)) for name, val in validators.items()))
+    if key not in _typed_structures:
+        cls = type(clsname, (Structure,), validators)
+        cls._recipe = (rebuild_typed_structure, key)
+        _typed_structures[key] = cls
+    return _typed_structures[key]
+
+def rebuild_typed_structure(clsname, fields):
+    return typed_structure(clsname, **{ name: validator() for name, validator in fields })
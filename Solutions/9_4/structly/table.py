@@ -0,0 +1,286 @@
+# table.py
+
+__all__ = [ 'StructureTable' ]
+
+from array import array
+from collections import deque
+from functools import reduce
+from itertools import chain, compress, islice
+from operator import and_
+import collections.abc
+from .validate import Validator, Typed, Positive, Nullable, Missing
+
+class StringColumn(collections.abc.Sequence):
+    '''
+    Dictionary encoded column of strings. Each distinct string is
+    stored once and the column itself is an array of integer codes.
+    '''
+    def __init__(self):
+        self.codes = array('i')
+        self.strings = []
+        self.index = { }
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, n):
+        return self.strings[self.codes[n]]
+
+    def __iter__(self):
+        return map(self.strings.__getitem__, self.codes)
+
+    def append(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        self.codes.append(code)
+
+    def extend(self, values):
+        # Only the new distinct strings need a loop in Python
+        values = list(values)
+        index = self.index
+        for value in dict.fromkeys(values):
+            if value not in index:
+                index[value] = len(self.strings)
+                self.strings.append(value)
+        self.codes.extend(map(index.__getitem__, values))
+
+    def truncate(self, n):
+        del self.codes[n:]
+
+# The bits of each byte value, lowest first
+_bits = [ tuple((byte >> n) & 1 for n in range(8)) for byte in range(256) ]
+
+def mask_flags(mask, count):
+    '''
+    Produce the first count bits of a bitmask as 0/1 flags
+    '''
+    return islice(chain.from_iterable(map(_bits.__getitem__, mask)), count)
+
+class NullableColumn(collections.abc.Sequence):
+    '''
+    Column that may hold Missing values. Values are kept in an ordinary
+    column, with a placeholder standing in for missing ones, and a
+    bitmask records which values are present.
+    '''
+    def __init__(self, values, placeholder):
+        self.values = values
+        self.placeholder = placeholder
+        self.mask = bytearray()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self.values)
+        value = self.values[n]
+        return value if self.mask[n >> 3] & (1 << (n & 7)) else Missing
+
+    def __iter__(self):
+        for value, present in zip(self.values, mask_flags(self.mask, len(self))):
+            yield value if present else Missing
+
+    def append(self, value):
+        n = len(self.values)
+        if n & 7 == 0:
+            self.mask.append(0)
+        if value is Missing:
+            self.values.append(self.placeholder)
+        else:
+            self.values.append(value)
+            self.mask[-1] |= 1 << (n & 7)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def present(self):
+        '''
+        Produce the values that aren't missing
+        '''
+        return compress(self.values, mask_flags(self.mask, len(self)))
+
+    def truncate(self, n):
+        truncate_column(self.values, n)
+        del self.mask[(n + 7) // 8:]
+        if n & 7:
+            self.mask[-1] &= (1 << (n & 7)) - 1
+
+def make_column(validator):
+    '''
+    Make an empty column suitable for the values of a validator
+    '''
+    expected_type = getattr(validator, 'expected_type', None)
+    if expected_type is int:
+        column, placeholder = array('q'), 0
+    elif expected_type is float:
+        column, placeholder = array('d'), 0.0
+    elif expected_type is str:
+        column, placeholder = StringColumn(), ''
+    else:
+        column, placeholder = [], None
+    if isinstance(validator, Nullable):
+        column = NullableColumn(column, placeholder)
+    return column
+
+def truncate_column(column, n):
+    '''
+    Cut a column back to its first n values
+    '''
+    if isinstance(column, (array, list)):
+        del column[n:]
+    else:
+        column.truncate(n)
+
+def widen_column(column):
+    '''
+    Return a column that holds the values of an array column (or the
+    values of a NullableColumn) in a list, so it can take any value,
+    such as ints too big for 64 bits
+    '''
+    if isinstance(column, NullableColumn):
+        column.values = widen_column(column.values)
+        return column
+    return list(column) if isinstance(column, array) else column
+
+def column_check(validator):
+    '''
+    Make a function that checks a whole column of converted values,
+    raising an exception if any of them are bad.  Type checks are
+    skipped, as the values come from the validator's own conversion.
+    '''
+    checks = { base for base in type(validator).__mro__ if 'check' in vars(base) }
+    checks -= { Validator, Typed, Nullable }
+    if not checks:
+        return lambda values: None
+    elif checks == { Positive } and not isinstance(validator, Nullable):
+        def check(values):
+            if min(values, default=0) < 0:
+                raise ValueError('must be >= 0')
+        return check
+    else:
+        return lambda values: deque(map(validator.compiled_check, values), 0)
+
+class StructureTable(collections.abc.Sequence):
+    '''
+    Column oriented storage for the records of a Structure class.
+    Records are handed out as instances of the class.
+    '''
+    def __init__(self, cls, records=()):
+        self.cls = cls
+        self.columns = { name: make_column(getattr(cls, name))
+                         for name in cls._fields }
+        self.create_append()
+        for record in records:
+            self.append(record)
+
+    def create_append(self):
+        '''
+        Create an append(record) method that checks every field of a
+        record before adding its values to the columns
+        '''
+        fields = self.cls._fields
+        env = { }
+        code = 'def append(record):\n'
+        code += f'    {", ".join(fields)}, = record\n'
+        for name in fields:
+            env[f'_check_{name}'] = getattr(self.cls, name).compiled_check
+            code += f'    {name} = _check_{name}({name})\n'
+        code += '    try:\n'
+        for name in fields:
+            code += f'        _append_{name}({name})\n'
+        code += '    except OverflowError:\n'
+        code += f'        _overflow([{", ".join(fields)}])\n'
+        env['_overflow'] = self.append_widened
+        exec(code, env)
+        self.append = env['append']
+        self.bind_columns()
+
+    def bind_columns(self):
+        '''
+        Point append() at the current columns.  append() may already be
+        held by callers, so the columns are swapped in its globals.
+        '''
+        for name, column in self.columns.items():
+            self.append.__globals__[f'_append_{name}'] = column.append
+
+    def append_widened(self, values):
+        '''
+        Redo an append() that failed with OverflowError part way through,
+        widening the columns that the values don't fit in
+        '''
+        n = min(map(len, self.columns.values()))
+        for name, value in zip(self.cls._fields, values):
+            column = self.columns[name]
+            truncate_column(column, n)
+            try:
+                column.append(value)
+            except OverflowError:
+                column = self.columns[name] = widen_column(column)
+                column.append(value)
+        self.bind_columns()
+
+    def extend_columns(self, columns):
+        '''
+        Add whole columns of converted and checked values, given in the
+        order of the fields
+        '''
+        widened = False
+        for name, values in zip(self.cls._fields, columns):
+            column = self.columns[name]
+            n = len(column)
+            try:
+                column.extend(values)
+            except OverflowError:
+                truncate_column(column, n)
+                column = self.columns[name] = widen_column(column)
+                column.extend(values)
+                widened = True
+        if widened:
+            self.bind_columns()
+
+    def __getstate__(self):
+        # The generated append() can't be pickled, so it is recreated
+        return { 'cls': self.cls, 'columns': self.columns }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.create_append()
+
+    def __len__(self):
+        return len(self.columns[self.cls._fields[0]])
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [ self[i] for i in range(*n.indices(len(self))) ]
+        return self.cls(*(col[n] for col in self.columns.values()))
+
+    def __iter__(self):
+        cls = self.cls
+        for values in zip(*self.columns.values()):
+            yield cls(*values)
+
+    def __repr__(self):
+        return '%s(%s, <%d records>)' % (type(self).__name__, self.cls.__name__, len(self))
+
+    def column(self, name):
+        '''
+        Return the column of values for a single field
+        '''
+        return self.columns[name]
+
+    def present(self, *names):
+        '''
+        Produce tuples of the values of the named fields, skipping the
+        records in which any of them are Missing
+        '''
+        columns = [ self.columns[name] for name in names ]
+        values = zip(*(getattr(col, 'values', col) for col in columns))
+        masks = [ int.from_bytes(col.mask, 'little') for col in columns
+                  if isinstance(col, NullableColumn) ]
+        if not masks:
+            return values
+        mask = reduce(and_, masks).to_bytes((len(self) + 7) // 8, 'little')
+        return compress(values, mask_flags(mask, len(self)))
@@ -1,5 +1,35 @@
 # validate.py
 
+from sys import intern
+from textwrap import dedent, indent
+
+class MissingType:
+    '''
+    Type of the Missing sentinel, used for missing values of nullable fields
+    '''
+    def __repr__(self):
+        return 'Missing'
+
+    def __bool__(self):
+        return False
+
+    def __reduce__(self):
+        return 'Missing'
+
+Missing = MissingType()
+
+# Field values that count as missing for nullable fields (None is JSON null)
+missing_values = frozenset({ '', '-', 'NA', 'N/A', None })
+
+def nullable(func):
+    '''
+    Wrap a conversion function so that missing values become Missing
+    instead of raising an exception
+    '''
+    def convert(value):
+        return Missing if value in missing_values else func(value)
+    return convert
+
 class Validator:
     def __init__(self, name=None):
         self.name = name
@@ -11,22 +41,65 @@ class Validator:
     def check(cls, value):
         return value
 
+    # Body of check(), minus the trailing call to the next check() in
+    # the MRO.  Subclasses give only this: check() is generated from it
+    # (see make_check()) and so is compiled_check
+    check_source = ''
+
     def __set__(self, instance, value):
-        instance.__dict__[self.name] = self.check(value)
+        instance.__dict__[self.name] = self.compiled_check(value)
+
+    @classmethod
+    def make_check(cls):
+        '''
+        Create a check() method from check_source that goes on to
+        the check() of the next class in the MRO
+        '''
+        code = 'def check(cls, value):\n'
+        code += indent(dedent(cls.check_source).strip() + '\n', '    ')
+        code += '    return super(_cls, cls).check(value)\n'
+        env = { '_cls': cls, 'Missing': Missing }
+        exec(code, env)
+        cls.check = classmethod(env['check'])
+
+    @classmethod
+    def compile_check(cls):
+        '''
+        Flatten the cooperative check() chain of the MRO into a single
+        function.  Falls back to check() if any class in the chain
+        doesn't provide its check_source.
+        '''
+        parts = []
+        for base in cls.__mro__:
+            if 'check' in vars(base):
+                if 'check_source' not in vars(base):
+                    cls.compiled_check = staticmethod(cls.check)
+                    return
+                parts.append(dedent(base.check_source).strip() + '\n')
+        code = 'def compiled_check(value):\n'
+        code += indent(''.join(parts), '    ')
+        code += '    return value\n'
+        env = { 'cls': cls, 'Missing': Missing }
+        exec(code, env)
+        cls.compiled_check = staticmethod(env['compiled_check'])
 
     # Collect all derived classes into a dict
     validators = { }
     @classmethod
     def __init_subclass__(cls):
         cls.validators[cls.__name__] = cls
+        if 'check_source' in vars(cls) and 'check' not in vars(cls):
+            cls.make_check()
+        cls.compile_check()
+
+Validator.compile_check()
 
 class Typed(Validator):
     expected_type = object
-    @classmethod
-    def check(cls, value):
+    check_source = '''
         if not isinstance(value, cls.expected_type):
             raise TypeError(f'expected {cls.expected_type}')
-        return super().check(value)
+    '''
 
 _typed_classes = [
     ('Integer', int),
@@ -37,18 +110,35 @@ globals().update((name, type(name, (Typed,), {'expected_type':ty}))
                  for name, ty in _typed_classes)
 
 class Positive(Validator):
-    @classmethod
-    def check(cls, value):
+    check_source = '''
         if value < 0:
             raise ValueError('must be >= 0')
-        return super().check(value)
+    '''
 
 class NonEmpty(Validator):
-    @classmethod
-    def check(cls, value):
+    check_source = '''
         if len(value) == 0:
             raise ValueError('must be non-empty')
-        return super().check(value)
+    '''
+
+class Nullable(Validator):
+    check_source = '''
+        if value is Missing:
+            return value
+    '''
+
+class NullableInteger(Nullable, Integer):
+    convert = staticmethod(nullable(int))
+
+class NullableFloat(Nullable, Float):
+    convert = staticmethod(nullable(float))
+
+class NullableString(Nullable, String):
+    convert = staticmethod(nullable(str))
+
+class InternedString(String):
+    # Row conversion used instead of expected_type (see validate_attributes)
+    convert = staticmethod(intern)
 
 class PositiveInteger(Integer, Positive):
     pass
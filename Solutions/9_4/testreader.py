@@ -0,0 +1,574 @@
+# testreader.py
+
+import pickle
+import stock
+import unittest
+from structly import *
+from structly.reader import csv_as_instances
+
+class TestReader(unittest.TestCase):
+    def test_read_csv_as_instances(self):
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        self.assertEqual(len(port), 7)
+        self.assertEqual(port[0], stock.Stock('AA', 100, 32.2))
+
+    def test_read_csv_as_dicts(self):
+        port = read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float])
+        self.assertEqual(port[0], {'name': 'AA', 'shares': 100, 'price': 32.2})
+
+    def test_headers(self):
+        port = read_csv_as_dicts('../../Data/portfolio_noheader.csv', [str, int, float],
+                                 headers=['name', 'shares', 'price'])
+        self.assertEqual(len(port), 7)
+        self.assertEqual(port[0], {'name': 'AA', 'shares': 100, 'price': 32.2})
+
+    def test_iter_csv_as_instances(self):
+        port = read_csv_as_instances('../../Data/missing.csv', stock.Stock)
+        records = iter_csv_as_instances('../../Data/missing.csv', stock.Stock)
+        self.assertEqual(next(records), port[0])
+        with self.assertLogs('structly.reader', 'WARNING'):
+            self.assertEqual(list(records), port[1:])
+
+    def test_iter_csv_as_dicts(self):
+        port = read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float])
+        records = iter_csv_as_dicts('../../Data/portfolio.csv', [str, int, float])
+        self.assertEqual(list(records), port)
+
+    def test_reordered_columns(self):
+        import os, tempfile
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.csv')
+            with open(filename, 'w') as f:
+                f.write('price,date,name,shares\n')
+                f.writelines(f'{s.price},6/11/2007,{s.name},{s.shares}\n' for s in port)
+            self.assertEqual(read_csv_as_instances(filename, stock.Stock), port)
+            self.assertIs(type(read_csv_as_instances(filename, stock.Stock)[0]), stock.Stock)
+            self.assertEqual(read_csv_as_instances(filename, stock.Stock, workers=2), port)
+            self.assertEqual(read_mmap_as_instances(filename, stock.Stock), port)
+            self.assertEqual(list(read_csv_as_table(filename, stock.Stock)), port)
+            self.assertEqual(read_csv_as_dicts(filename, {'name': str, 'shares': int}),
+                             [ {'name': s.name, 'shares': s.shares} for s in port ])
+            self.assertEqual(read_mmap_as_dicts(filename, {'name': str, 'shares': int}),
+                             [ {'name': s.name, 'shares': s.shares} for s in port ])
+
+    def test_read_parallel(self):
+        with self.assertLogs('structly.reader', 'WARNING') as serial_logs:
+            port = read_csv_as_instances('../../Data/missing.csv', stock.Stock)
+        with self.assertLogs('structly.reader', 'WARNING') as parallel_logs:
+            records = read_csv_as_instances('../../Data/missing.csv', stock.Stock, workers=3)
+        self.assertEqual(records, port)
+        self.assertEqual(parallel_logs.output, serial_logs.output)
+
+    def test_read_many(self):
+        import gzip, os, shutil, tempfile
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for n in range(3):
+                shutil.copy('../../Data/portfolio.csv', os.path.join(tmpdir, f'port{n}.csv'))
+            shutil.copy('../../Data/missing.csv', os.path.join(tmpdir, 'port3.csv'))
+            errors = { }
+            with self.assertLogs('structly.reader', 'WARNING'):
+                table = read_many(tmpdir, stock.Stock, workers=2, errors=errors)
+            missing = read_csv_as_instances('../../Data/missing.csv', stock.Stock)
+            self.assertEqual(list(table), port * 3 + missing)
+            self.assertEqual(list(errors), [os.path.join(tmpdir, 'port3.csv')])
+            self.assertEqual(len(errors[os.path.join(tmpdir, 'port3.csv')]), 8)
+
+            records = read_many(os.path.join(tmpdir, 'port[0-2].csv'), stock.Stock,
+                                stream=True, processes=False)
+            self.assertEqual(list(records), port * 3)
+
+            table = read_many(os.path.join(tmpdir, 'port[0-2].csv'), stock.Stock, fields=['name'])
+            self.assertEqual([ s.name for s in table ], [ s.name for s in port ] * 3)
+
+            with open('../../Data/portfolio.csv', 'rb') as f:
+                data = f.read()
+            for n in range(2):
+                with gzip.open(os.path.join(tmpdir, f'port{n}.csv.gz'), 'wb') as f:
+                    f.write(data)
+            self.assertEqual(list(read_many(os.path.join(tmpdir, '*.gz'), stock.Stock)), port * 2)
+
+            # A where that can't be sent to worker processes fails the call, not each file
+            with self.assertRaises((pickle.PicklingError, AttributeError)):
+                read_many(tmpdir, stock.Stock, where=lambda shares: shares > 100, processes=True)
+            table = read_many(os.path.join(tmpdir, 'port[0-2].csv'), stock.Stock,
+                              where=lambda shares: shares > 100, processes=False)
+            self.assertEqual(list(table), [ s for s in port if s.shares > 100 ] * 3)
+
+    def test_read_mmap(self):
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        self.assertEqual(read_mmap_as_instances('../../Data/portfolio.csv', stock.Stock), port)
+        port = read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float])
+        self.assertEqual(read_mmap_as_dicts('../../Data/portfolio.csv', [str, int, float]), port)
+
+    def test_read_mmap_quoted(self):
+        import os, tempfile
+        from structly.reader import mmap_rows
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.csv')
+            with open(filename, 'w', newline='') as f:
+                f.write('name,shares,price\n"Acme, Inc",100,32.2\r\n'
+                        '"Say ""hi"", Bob",50,91.1\n"""AA""",75,2.5\nIBM,25,40.0')
+            port = read_csv_as_instances(filename, stock.Stock)
+            self.assertEqual([ s.name for s in port ], ['Acme, Inc', 'Say "hi", Bob', '"AA"', 'IBM'])
+            self.assertEqual(read_mmap_as_instances(filename, stock.Stock), port)
+            self.assertEqual(read_mmap_as_dicts(filename, [str, int, float]),
+                             read_csv_as_dicts(filename, [str, int, float]))
+            for block_size in [1, 20, 1 << 20]:
+                with open(filename, 'rb') as f:
+                    self.assertEqual(len(list(mmap_rows(f, block_size))), 5)
+
+    def test_columns(self):
+        port = read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float],
+                                 columns=['price', 'name'])
+        self.assertEqual(port[0], {'price': 32.2, 'name': 'AA'})
+        self.assertEqual(read_mmap_as_dicts('../../Data/portfolio.csv', [str, int, float],
+                                            columns=['price', 'name']), port)
+        with self.assertRaises(ValueError):
+            read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float], columns=['cost'])
+
+    def test_fields(self):
+        for reader in [read_csv_as_instances, read_mmap_as_instances, read_csv_as_table]:
+            port = reader('../../Data/portfolio.csv', stock.Stock, fields=['name', 'price'])
+            self.assertEqual(len(port), 7)
+            self.assertIsInstance(port[0], stock.Stock)
+            self.assertEqual(port[0]._fields, ('name', 'price'))
+            self.assertEqual((port[0].name, port[0].price), ('AA', 32.2))
+            with self.assertRaises(AttributeError):
+                port[0].shares
+            with self.assertRaises(AttributeError):
+                port[0].cost
+            self.assertFalse(hasattr(port[0], 'shares'))
+
+    def test_where(self):
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        expected = [ s for s in port if s.shares > 100 ]
+        for reader in [read_csv_as_instances, read_mmap_as_instances, read_csv_as_table,
+                       iter_csv_as_instances]:
+            records = reader('../../Data/portfolio.csv', stock.Stock, where=lambda shares: shares > 100)
+            self.assertEqual(list(records), expected)
+        records = read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float],
+                                    where=lambda name, price: name == 'IBM' and price > 80)
+        self.assertEqual(records, [{'name': 'IBM', 'shares': 50, 'price': 91.1}])
+
+    def test_where_bad_rows(self):
+        # Rows are only rejected as bad if the columns used by where can't be converted
+        with self.assertNoLogs('structly.reader', 'WARNING'):
+            records = read_csv_as_instances('../../Data/missing.csv', stock.Stock,
+                                            where=lambda name: name == 'AA')
+        self.assertEqual(records, [stock.Stock('AA', 15, 39.48)])
+
+    def test_bad_rows(self):
+        errors = BadRows(log_limit=2)
+        with self.assertLogs('structly.reader', 'WARNING') as logs:
+            records = read_csv_as_instances('../../Data/missing.csv', stock.Stock, errors=errors)
+        self.assertEqual(len(records), 20)
+        self.assertEqual(len(logs.records), 3)
+        self.assertIn('6 not shown', logs.output[-1])
+        self.assertEqual(len(errors), 8)
+        self.assertEqual(list(errors)[:2], [(4, 'shares', 'missing'), (7, 'price', 'type')])
+        self.assertEqual(errors.counts(), {'missing': 7, 'type': 1})
+
+        errors = BadRows()
+        lines = ['name,shares,price', 'AA,100,32.2', 'IBM,-50,91.1']
+        with self.assertLogs('structly.reader', 'WARNING'):
+            csv_as_instances(lines, stock.Stock, errors=errors)
+        self.assertEqual(list(errors), [(2, 'shares', 'check')])
+
+    def test_cache(self):
+        import os, shutil, tempfile
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.csv')
+            shutil.copy('../../Data/portfolio.csv', filename)
+            port = read_csv_as_instances(filename, stock.Stock, cache=True)
+            self.assertEqual(len(os.listdir(tmpdir)), 2)
+            self.assertEqual(read_csv_as_instances(filename, stock.Stock, cache=True), port)
+            table = read_csv_as_table(filename, stock.Stock, cache=tmpdir)
+            self.assertEqual(list(read_csv_as_table(filename, stock.Stock, cache=tmpdir)), list(table))
+
+            # Changing the file invalidates the cache
+            with open(filename, 'a') as f:
+                f.write('"HPQ",10,30.5\n')
+            self.assertEqual(len(read_csv_as_instances(filename, stock.Stock, cache=True)), 8)
+            self.assertEqual(len(read_csv_as_table(filename, stock.Stock, cache=tmpdir)), 8)
+
+            # So does reading with a different schema
+            dicts = read_csv_as_dicts(filename, [str, int, float], cache=True)
+            self.assertEqual(dicts[-1], {'name': 'HPQ', 'shares': 10, 'price': 30.5})
+
+            # Lambdas are told apart by their code, not their name
+            dicts = read_csv_as_dicts(filename, [str, lambda x: int(x) * 2, float], cache=True)
+            self.assertEqual(dicts[-1]['shares'], 20)
+            dicts = read_csv_as_dicts(filename, [str, lambda x: int(x) * 3, float], cache=True)
+            self.assertEqual(dicts[-1]['shares'], 30)
+
+            # A cache directory is made if needed
+            cachedir = os.path.join(tmpdir, 'cache', 'csv')
+            self.assertEqual(read_csv_as_instances(filename, stock.Stock, cache=cachedir),
+                             read_csv_as_instances(filename, stock.Stock))
+            self.assertEqual(len(os.listdir(cachedir)), 1)
+
+    def test_cache_unpicklable(self):
+        import os, shutil, tempfile
+        class Holding(Structure):
+            name = String()
+            shares = PositiveInteger()
+            price = PositiveFloat()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.csv')
+            shutil.copy('../../Data/portfolio.csv', filename)
+            with self.assertLogs('structly.reader', 'DEBUG'):
+                port = read_csv_as_instances(filename, Holding, cache=True)
+            self.assertEqual(len(port), 7)
+            self.assertEqual(os.listdir(tmpdir), ['portfolio.csv'])
+
+    def test_memory_limit(self):
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        records = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock, memory_limit=1000)
+        self.assertGreater(records.nspilled, 0)
+        self.assertEqual(len(records), len(port))
+        self.assertEqual(list(records), port)
+        self.assertEqual(records[1], port[1])
+        self.assertEqual(records[-1], port[-1])
+        self.assertEqual(records[2:5], port[2:5])
+        self.assertEqual(pickle.loads(pickle.dumps(records)), port)
+
+        records = read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float],
+                                    memory_limit=1000, workers=2)
+        self.assertEqual(list(records), read_csv_as_dicts('../../Data/portfolio.csv', [str, int, float]))
+
+        # The parallel reader splits the file into chunks that fit the limit
+        import os, tempfile
+        from unittest import mock
+        from structly import reader
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.csv')
+            with open('../../Data/portfolio.csv') as f:
+                header = f.readline()
+                data = f.read()
+            with open(filename, 'w') as f:
+                f.write(header + data * 100)
+            with mock.patch.object(reader, 'csv_ranges', wraps=reader.csv_ranges) as csv_ranges:
+                records = read_csv_as_instances(filename, stock.Stock, memory_limit=20000, workers=2)
+            self.assertGreater(csv_ranges.call_args.args[3], 2 * 4)
+            self.assertEqual(list(records), port * 100)
+
+    def test_split_csv(self):
+        import csv
+        from structly.reader import split_csv
+        lines = ['a,b\n', '\n', 'c,d\r\n', '1,"x,y"\n', '2,3\n']
+        self.assertEqual(list(split_csv(lines, sample=1)), list(csv.reader(lines)))
+        self.assertEqual(list(split_csv(lines)), list(csv.reader(lines)))
+
+    def test_compressed(self):
+        import bz2, lzma, os, tempfile
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        self.assertEqual(read_csv_as_instances('../../Data/portfolio.csv.gz', stock.Stock), port)
+        self.assertEqual(read_csv_as_instances('../../Data/portfolio.csv.gz', stock.Stock,
+                                               threaded=True, workers=2), port)
+        with open('../../Data/portfolio.csv', 'rb') as f:
+            data = f.read()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for module in [bz2, lzma]:
+                filename = os.path.join(tmpdir, 'portfolio.csv.' + module.__name__)
+                with module.open(filename, 'wb') as f:
+                    f.write(data)
+                self.assertEqual(read_csv_as_instances(filename, stock.Stock), port)
+                self.assertEqual(read_csv_as_table(filename, stock.Stock, threaded=True)[:], port)
+                records = iter_csv_as_instances(filename, stock.Stock, threaded=True)
+                self.assertEqual(next(records), port[0])
+                records.close()
+
+    def test_iter_csv_batches(self):
+        port = read_csv_as_instances('../../Data/missing.csv', stock.Stock)
+        with self.assertLogs('structly.reader', 'WARNING'):
+            batches = list(iter_csv_batches('../../Data/missing.csv', stock.Stock, batch_size=6))
+        self.assertEqual([len(batch) for batch in batches], [6, 6, 6, 2])
+        self.assertEqual(sum(batches, []), port)
+        with self.assertLogs('structly.reader', 'WARNING'):
+            batches = list(iter_csv_batches('../../Data/missing.csv', stock.Stock, batch_size=6,
+                                            columnar=True))
+        self.assertIsInstance(batches[0], StructureTable)
+        self.assertEqual([ rec for batch in batches for rec in batch ], port)
+
+    def test_short_rows(self):
+        import os, tempfile
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.csv')
+            with open(filename, 'w') as f:
+                f.write('name,shares,price\nAA,100,32.2\nIBM,50\n\nCAT,150,83.44\n')
+            expected = [stock.Stock('AA', 100, 32.2), stock.Stock('CAT', 150, 83.44)]
+            for reader, kwargs in [(read_csv_as_instances, {}), (read_csv_as_instances, {'workers': 2}),
+                                   (read_csv_as_table, {}), (read_mmap_as_instances, {}),
+                                   (iter_csv_as_instances, {})]:
+                with self.subTest(reader=reader.__name__, **kwargs):
+                    errors = BadRows()
+                    with self.assertLogs('structly.reader', 'WARNING'):
+                        records = list(reader(filename, stock.Stock, errors=errors, **kwargs))
+                    self.assertEqual(records, expected)
+                    self.assertEqual(list(errors), [(2, 'price', 'missing'), (3, 'name', 'missing')])
+
+            expected = [ {'name': s.name, 'shares': s.shares, 'price': s.price} for s in expected ]
+            for reader, kwargs in [(read_csv_as_dicts, {}), (read_csv_as_dicts, {'workers': 2}),
+                                   (read_mmap_as_dicts, {}), (iter_csv_as_dicts, {})]:
+                with self.subTest(reader=reader.__name__, **kwargs):
+                    errors = BadRows()
+                    with self.assertLogs('structly.reader', 'WARNING'):
+                        records = list(reader(filename, [str, int, float], errors=errors, **kwargs))
+                    self.assertEqual(records, expected)
+                    self.assertEqual(list(errors), [(2, 'price', 'missing'), (3, 'name', 'missing')])
+
+    def test_empty_file(self):
+        import os, tempfile
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'empty.csv')
+            open(filename, 'w').close()
+            self.assertEqual(read_csv_as_instances(filename, stock.Stock), [])
+            self.assertEqual(read_csv_as_instances(filename, stock.Stock, workers=2), [])
+            self.assertEqual(read_csv_as_dicts(filename, [str, int, float]), [])
+            self.assertEqual(len(read_csv_as_table(filename, stock.Stock)), 0)
+            self.assertEqual(list(iter_csv_as_instances(filename, stock.Stock)), [])
+            self.assertEqual(list(iter_csv_as_dicts(filename, [str, int, float])), [])
+            self.assertEqual(list(iter_csv_batches(filename, stock.Stock)), [])
+            with self.assertRaises(ValueError):
+                infer_structure(filename)
+
+    def test_read_csv_as_table(self):
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        table = read_csv_as_table('../../Data/portfolio.csv', stock.Stock)
+        self.assertEqual(len(table), 7)
+        self.assertEqual(table[1], port[1])
+        self.assertEqual(list(table), port)
+        self.assertEqual(table[-2:], port[-2:])
+        self.assertEqual(list(table.column('name')), [s.name for s in port])
+        self.assertEqual(sum(table.column('shares')), sum(s.shares for s in port))
+
+    def test_table_checks_once(self):
+        from structly.validate import Integer
+        class CountedInteger(Integer):
+            calls = 0
+            check_source = 'cls.calls += 1'
+        class Holding(Structure):
+            name = String()
+            shares = CountedInteger()
+        read_csv_as_table('../../Data/portfolio.csv', Holding)
+        self.assertEqual(CountedInteger.calls, 7)
+        list(iter_csv_batches('../../Data/portfolio.csv', Holding, batch_size=3, columnar=True))
+        self.assertEqual(CountedInteger.calls, 14)
+
+    def test_table_bad_rows(self):
+        with self.assertLogs('structly.reader', 'WARNING'):
+            table = read_csv_as_table('../../Data/missing.csv', stock.Stock)
+        port = read_csv_as_instances('../../Data/missing.csv', stock.Stock)
+        self.assertEqual(list(table), port)
+
+    def test_table_append(self):
+        table = StructureTable(stock.Stock)
+        table.append(stock.Stock('AA', 100, 32.2))
+        table.append(('IBM', 50, 91.1))
+        with self.assertRaises(ValueError):
+            table.append(('CAT', -150, 83.44))
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table[1], stock.Stock('IBM', 50, 91.1))
+
+    def test_table_big_ints(self):
+        import os, tempfile
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.csv')
+            with open(filename, 'w') as f:
+                f.write(f'name,shares,price\nAA,100,32.2\nIBM,{2**70},91.1\nCAT,150,83.44\n')
+            port = read_csv_as_instances(filename, stock.Stock)
+            table = read_csv_as_table(filename, stock.Stock)
+            self.assertEqual(list(table), port)
+            self.assertEqual(len(table.column('name')), 3)
+            self.assertEqual(list(read_many(filename, stock.Stock, processes=False)), port)
+
+        table = StructureTable(stock.Stock, port[:1])
+        table.extend_columns([['IBM'], [2**64], [91.1]])
+        self.assertEqual(table[1], stock.Stock('IBM', 2**64, 91.1))
+
+        # Columns of every kind are cut back before the int column is widened
+        class Holding(Structure):
+            name = NullableString()
+            shares = Integer()
+            price = NullableFloat()
+        table = StructureTable(Holding)
+        table.append(['AA', 100, Missing])
+        table.append(['IBM', 2**70, 91.1])
+        table.append([Missing, 50, 1.0])
+        self.assertEqual(list(table), [Holding('AA', 100, Missing), Holding('IBM', 2**70, 91.1),
+                                       Holding(Missing, 50, 1.0)])
+
+    def test_nullable(self):
+        class Holding(Structure):
+            name = String()
+            shares = NullableInteger()
+            price = NullableFloat()
+        with self.assertNoLogs('structly.reader', 'WARNING'):
+            port = read_csv_as_instances('../../Data/missing.csv', Holding)
+            table = read_csv_as_table('../../Data/missing.csv', Holding)
+        self.assertEqual(len(port), 28)
+        self.assertIs(port[3].shares, Missing)
+        self.assertIs(port[6].price, Missing)
+        self.assertEqual(list(table), port)
+        self.assertIs(table.column('shares')[3], Missing)
+        self.assertEqual(sum(table.column('shares').present()),
+                         sum(h.shares for h in port if h.shares is not Missing))
+        self.assertEqual(sum(s * p for s, p in table.present('shares', 'price')),
+                         sum(h.shares * h.price for h in port if h.shares and h.price))
+        self.assertIs(pickle.loads(pickle.dumps(Missing)), Missing)
+        with self.assertRaises(TypeError):
+            port[0].shares = None
+
+    def test_read_dat_as_table(self):
+        import os, tempfile
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        table = read_dat_as_table('../../Data/portfolio.dat', stock.Stock)
+        self.assertEqual(list(table), port)
+
+        # Blocks with bad lines are redone line by line
+        errors = BadRows()
+        with self.assertLogs('structly.reader', 'WARNING'):
+            table = read_dat_as_table('../../Data/portfolio3.dat', stock.Stock,
+                                      block_size=100, errors=errors)
+        self.assertEqual(list(table), read_csv_as_instances('../../Data/missing.csv', stock.Stock))
+        self.assertEqual(list(errors)[:2], [(4, 'shares', 'type'), (7, 'shares', 'type')])
+
+        # Lines with the wrong number of fields
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.dat')
+            with open(filename, 'w') as f:
+                f.write('AA 100\nIBM 50 91.1 CAT\n150 83.44\n\nMSFT 200 51.23\n')
+            with self.assertLogs('structly.reader', 'WARNING'):
+                table = read_dat_as_table(filename, stock.Stock)
+            self.assertEqual(list(table), [stock.Stock('MSFT', 200, 51.23)])
+
+            # Misaligned lines whose fields add up to whole rows
+            errors = BadRows()
+            with open(filename, 'w') as f:
+                f.write('x 1\n1 x 1 1\n')
+            with self.assertLogs('structly.reader', 'WARNING'):
+                table = read_dat_as_table(filename, stock.Stock, errors=errors)
+            self.assertEqual(list(table), [])
+            self.assertEqual(len(errors), 2)
+
+            # Fixed width fields
+            with open(filename, 'w') as f:
+                f.writelines(f'{s.name:<6}{s.shares:>5}{s.price:>8.2f}\n' for s in port)
+            table = read_dat_as_table(filename, stock.Stock, widths=[6, 5, 8])
+            self.assertEqual(list(table), port)
+
+    def test_convert_column(self):
+        from structly.reader import convert_column
+        ints = convert_column(int, ['100', ' 5', '+7', '-3'])
+        self.assertEqual((ints.typecode, list(ints)), ('q', [100, 5, 7, -3]))
+        floats = convert_column(float, ['32.2', '1e3', '-0.5'])
+        self.assertEqual((floats.typecode, list(floats)), ('d', [32.2, 1000.0, -0.5]))
+        self.assertEqual(convert_column(str, ['AA']), ['AA'])
+        for func, values in [(int, ['1', '1.5']), (int, ['']), (float, ['x'])]:
+            with self.assertRaises(ValueError):
+                convert_column(func, values)
+        with self.assertRaises(OverflowError):
+            convert_column(int, [str(2**70)])
+
+    def test_jsonl(self):
+        import os, tempfile
+        port = read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'portfolio.jsonl')
+            write_jsonl(filename, port)
+            with open(filename) as f:
+                self.assertEqual(f.readline(), '{"name":"AA","shares":100,"price":32.2}\n')
+            self.assertEqual(list(iter_jsonl_as_instances(filename, stock.Stock)), port)
+
+            write_jsonl(filename, port, keys={'shares': 'qty'})
+            with open(filename, 'a') as f:
+                f.write('{"name":"CAT","qty":-1,"price":1.0}\n{"name":\n{"name":"GE","price":2.0}\n')
+            errors = BadRows()
+            with self.assertLogs('structly.reader', 'WARNING'):
+                records = list(iter_jsonl_as_instances(filename, stock.Stock, keys={'shares': 'qty'},
+                                                       errors=errors))
+            self.assertEqual(records, port)
+            self.assertEqual(list(errors), [(8, 'qty', 'check'), (9, None, 'other'), (10, 'qty', 'missing')])
+
+            # Values JSON already typed are checked, not converted
+            with open(filename, 'w') as f:
+                f.write('{"name":5,"shares":12,"price":32.2}\n'
+                        '{"name":"AA","shares":12.9,"price":32.2}\n'
+                        '{"name":"AA","shares":"12","price":"32.2"}\n'
+                        '{"name":"AA","shares":true,"price":32.2}\n'
+                        '{"name":"AA","shares":12,"price":null}\n'
+                        '{"name":"AA","shares":"x","price":1.0}\n'
+                        '{"name":"AA","shares":12,"price":-1.0}\n'
+                        '{"name":"AA","shares":12,"price":32}\n'
+                        '{"name":"AA","shares":12,"price":false}\n')
+            errors = BadRows()
+            with self.assertLogs('structly.reader', 'WARNING'):
+                records = list(iter_jsonl_as_instances(filename, stock.Stock, errors=errors))
+            self.assertEqual(records, [stock.Stock('AA', 12, 32.2), stock.Stock('AA', 12, 32.0)])
+            self.assertIs(type(records[1].price), float)
+            self.assertEqual(list(errors), [(1, 'name', 'type'), (2, 'shares', 'type'),
+                                            (4, 'shares', 'type'), (5, 'price', 'missing'),
+                                            (6, 'shares', 'type'), (7, 'price', 'check'),
+                                            (9, 'price', 'type')])
+
+            class Holding(Structure):
+                name = String()
+                shares = NullableInteger()
+            with open(filename, 'w') as f:
+                f.write('{"name":"AA","shares":null}\n{"name":"AA","shares":""}\n')
+            self.assertEqual([ h.shares for h in iter_jsonl_as_instances(filename, Holding) ],
+                             [Missing, Missing])
+
+    def test_infer_structure(self):
+        Portfolio = infer_structure('../../Data/portfolio.csv')
+        self.assertEqual(Portfolio.__name__, 'Portfolio')
+        self.assertEqual(Portfolio._fields, ('name', 'shares', 'price'))
+        self.assertEqual(Portfolio._types, (str, int, float))
+        port = read_csv_as_instances('../../Data/portfolio.csv', Portfolio)
+        self.assertEqual([tuple(s) for s in port],
+                         [tuple(s) for s in read_csv_as_instances('../../Data/portfolio.csv', stock.Stock)])
+        Prices = infer_structure('../../Data/prices.csv', headers=['name', 'price'], clsname='Price')
+        self.assertEqual(Prices._fields, ('name', 'price'))
+        self.assertEqual(Prices._types, (str, float))
+
+        import os, tempfile
+        from structly.validate import Integer, String, NullableInteger, NullableFloat
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'data.csv')
+            with open(filename, 'w') as f:
+                f.write('a b,a_b,c\n1,2,3\n4,5\n')
+            Data = infer_structure(filename)
+            self.assertEqual(Data._fields, ('a_b', 'a_b_2', 'c'))
+            self.assertEqual([ type(getattr(Data, name)) for name in Data._fields ],
+                             [Integer, Integer, NullableInteger])
+
+        # Missing values make nullable fields
+        Partial = infer_structure('../../Data/missing.csv')
+        self.assertEqual([ type(getattr(Partial, name)) for name in Partial._fields ],
+                         [String, NullableInteger, NullableFloat])
+        with self.assertNoLogs('structly.reader', 'WARNING'):
+            port = read_csv_as_instances('../../Data/missing.csv', Partial)
+        self.assertEqual(len(port), 28)
+        self.assertEqual((port[3].shares, port[6].price), (Missing, Missing))
+
+        # Inferred classes are pickled by recipe, so they can go to worker
+        # processes and into spill files and caches
+        self.assertIs(pickle.loads(pickle.dumps(Partial)), Partial)
+        self.assertEqual(pickle.loads(pickle.dumps(port)), port)
+        fields = Partial.project(['price'])
+        self.assertIs(pickle.loads(pickle.dumps(fields)), fields)
+        self.assertEqual(read_csv_as_instances('../../Data/missing.csv', Partial, workers=2), port)
+        self.assertEqual(list(read_csv_as_instances('../../Data/missing.csv', Partial,
+                                                    memory_limit=500)), port)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertEqual(read_csv_as_instances('../../Data/missing.csv', Partial,
+                                                   cache=tmpdir), port)
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+            self.assertEqual(read_csv_as_instances('../../Data/missing.csv', Partial,
+                                                   cache=tmpdir), port)
+        self.assertEqual(list(read_many('../../Data/missing.csv', Partial, workers=2)), port)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# teststock.py
+
+import stock
+import unittest
+from structly import Structure
+from structly.validate import PositiveInteger, Validator, Missing
+
+class SlottedStock(Structure, slots=True):
+    name = String()
+    shares = PositiveInteger()
+    price = PositiveFloat()
+
+class TestStock(unittest.TestCase):
+    def test_create(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        self.assertEqual(s.name, 'GOOG')
+        self.assertEqual(s.shares, 100)
+        self.assertEqual(s.price, 490.1)
+
+    def test_create_keyword(self):
+        s = stock.Stock(name='GOOG', shares=100, price=490.1)
+        self.assertEqual(s.name, 'GOOG')
+        self.assertEqual(s.shares, 100)
+        self.assertEqual(s.price, 490.1)
+
+    def test_cost(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        self.assertEqual(s.cost, 49010.0)
+
+    def test_sell(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        s.sell(25)
+        self.assertEqual(s.shares, 75)
+
+    def test_from_row(self):
+        s = stock.Stock.from_row(['GOOG','100','490.1'])
+        self.assertEqual(s.name, 'GOOG')
+        self.assertEqual(s.shares, 100)
+        self.assertEqual(s.price, 490.1)
+
+    def test_from_rows(self):
+        recs = stock.Stock.from_rows([['GOOG','100','490.1'], ['AA','50','32.2']])
+        self.assertEqual(recs, [stock.Stock('GOOG', 100, 490.1),
+                                stock.Stock('AA', 50, 32.2)])
+
+    def test_from_row_badvalue(self):
+        with self.assertRaises(ValueError):
+            stock.Stock.from_row(['GOOG','-100','490.1'])
+        with self.assertRaises(ValueError):
+            stock.Stock.from_row(['GOOG','','490.1'])
+
+    def test_repr(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        self.assertEqual(repr(s), "Stock('GOOG', 100, 490.1)")
+
+    def test_eq(self):
+        a = stock.Stock('GOOG', 100, 490.1)
+        b = stock.Stock('GOOG', 100, 490.1)
+        self.assertTrue(a==b)
+
+    # Tests for failure conditions
+    def test_shares_badtype(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        with self.assertRaises(TypeError):
+            s.shares = '50'
+
+    def test_shares_badvalue(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        with self.assertRaises(ValueError):
+            s.shares = -50
+
+    def test_price_badtype(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        with self.assertRaises(TypeError):
+            s.price = '45.23'
+
+    def test_price_badvalue(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        with self.assertRaises(ValueError):
+            s.price = -45.23
+
+    def test_bad_attribute(self):
+        s = stock.Stock('GOOG', 100, 490.1)
+        with self.assertRaises(AttributeError):
+            s.share = 100
+
+    def test_compiled_check_errors(self):
+        for value in ['50', -50]:
+            with self.assertRaises(Exception) as cooperative:
+                PositiveInteger.check(value)
+            with self.assertRaises(Exception) as compiled:
+                PositiveInteger.compiled_check(value)
+            self.assertEqual(repr(cooperative.exception), repr(compiled.exception))
+
+    def test_compiled_check_matches_check(self):
+        def outcome(check, value):
+            try:
+                return check(value)
+            except Exception as e:
+                return repr(e)
+        for name, validator in Validator.validators.items():
+            for value in ['50', '', -50, 50, 5.0, Missing]:
+                with self.subTest(validator=name, value=value):
+                    self.assertEqual(outcome(validator.check, value),
+                                     outcome(validator.compiled_check, value))
+
+class TestSlottedStock(unittest.TestCase):
+    def test_create(self):
+        s = SlottedStock('GOOG', 100, 490.1)
+        self.assertEqual(SlottedStock._fields, ('name', 'shares', 'price'))
+        self.assertEqual(repr(s), "SlottedStock('GOOG', 100, 490.1)")
+        self.assertEqual(s, SlottedStock.from_row(['GOOG','100','490.1']))
+
+    def test_no_dict(self):
+        s = SlottedStock('GOOG', 100, 490.1)
+        self.assertFalse(hasattr(s, '__dict__'))
+
+    def test_validation(self):
+        s = SlottedStock('GOOG', 100, 490.1)
+        with self.assertRaises(TypeError):
+            s.shares = '50'
+        with self.assertRaises(ValueError):
+            s.price = -45.23
+        with self.assertRaises(AttributeError):
+            s.share = 100
+        s.shares = 75
+        self.assertEqual(s.shares, 75)
+
+if __name__ == '__main__':
+    unittest.main()